@@ -0,0 +1,36 @@
+import argparse
+import sys
+from typing import Any, Dict, Sequence
+from benchmarks.harness import load
+
+def main(argv: Sequence[str]) -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description = "Compare two benchmark result files.")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type = float, default = 0.1, help = "relative change reported as a regression")
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    base: Dict[str, Any] = {r["key"]: r for r in load(args.base)["results"]}
+    new: Dict[str, Any] = {r["key"]: r for r in load(args.new)["results"]}
+    regressions: int = 0
+    for key in sorted(base.keys() & new.keys()):
+        old_value: float = base[key]["median"]
+        new_value: float = new[key]["median"]
+        if old_value == 0:
+            continue
+        change: float = (new_value - old_value) / old_value
+        if base[key]["higher_is_better"]:
+            change = -change
+        flag: str = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improvement"
+        print(f"{key:<90} {old_value:>12.4g} {new_value:>12.4g} {change:>+8.1%} {flag}")
+    for key in sorted(base.keys() - new.keys()):
+        print(f"{key:<90} missing from {args.new}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
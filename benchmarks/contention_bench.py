@@ -0,0 +1,46 @@
+import sys
+import threading
+import time
+from typing import Callable, List, Sequence, Tuple
+from pyfunccache.cache import Cache, ConcurrentCache, SnapshotCache, SyncCache
+
+KEYS: int = 1000
+
+def candidates() -> List[Tuple[str, Callable[[], Cache[int, int]]]]:
+    return [
+        ("SyncCache", SyncCache[int, int]),
+        ("ConcurrentCache", ConcurrentCache[int, int]),
+        ("SnapshotCache", SnapshotCache[int, int]),
+    ]
+
+def measure(cache: Cache[int, int], threads: int, reads: int, write_every: int) -> float:
+    for key in range(KEYS):
+        cache.save(key, key)
+    barrier: threading.Barrier = threading.Barrier(threads + 1)
+
+    def worker(seed: int) -> None:
+        barrier.wait()
+        for j in range(reads):
+            key: int = (seed * 7919 + j) % KEYS
+            if write_every and j % write_every == 0:
+                cache.save(key, j)
+            else:
+                cache.get_line(key).result
+
+    pool: List[threading.Thread] = [threading.Thread(target = worker, args = (t, )) for t in range(threads)]
+    for t in pool: t.start()
+    barrier.wait()
+    start: float = time.perf_counter()
+    for t in pool: t.join()
+    return threads * reads / (time.perf_counter() - start)
+
+def main(argv: Sequence[str]) -> None:
+    reads: int = int(argv[1]) if len(argv) > 1 else 100000
+    write_every: int = int(argv[2]) if len(argv) > 2 else 1000
+    print(f"{'cache':<16} {'threads':>7} {'ops/s':>14}")
+    for name, factory in candidates():
+        for threads in (1, 2, 4, 8, 16, 32):
+            print(f"{name:<16} {threads:>7} {measure(factory(), threads, reads, write_every):>14.0f}")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,86 @@
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+@dataclass(frozen = True)
+class Result:
+    group: str
+    name: str
+    unit: str
+    values: List[float]
+    params: Dict[str, Any] = field(default_factory = dict)
+    higher_is_better: bool = False
+
+    @property
+    def key(self) -> str:
+        params: str = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.group}/{self.name}" + (f"[{params}]" if params else "")
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.values)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "group": self.group,
+            "name": self.name,
+            "params": self.params,
+            "unit": self.unit,
+            "higher_is_better": self.higher_is_better,
+            "values": self.values,
+            "median": self.median,
+            "min": min(self.values),
+            "max": max(self.values),
+            "stdev": statistics.stdev(self.values) if len(self.values) > 1 else 0.0,
+        }
+
+def calibrate(fn: Callable[[], None], target: float) -> int:
+    loops: int = 1
+    while True:
+        start: float = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= target or loops >= 1 << 24:
+            return loops
+        loops *= 2
+
+def per_call(fn: Callable[[], None], repeat: int, target: float) -> List[float]:
+    loops: int = calibrate(fn, target)
+    values: List[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        values.append((time.perf_counter() - start) / loops)
+    return values
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata() -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "gil": getattr(sys, "_is_gil_enabled", lambda: True)(),
+        "revision": git_revision(),
+    }
+
+def dump(results: List[Result], path: str) -> None:
+    with open(path, "w") as fh:
+        json.dump({"metadata": metadata(), "results": [r.to_json() for r in results]}, fh, indent = 2)
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, "r") as fh:
+        return dict(json.load(fh))
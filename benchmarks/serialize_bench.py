@@ -0,0 +1,50 @@
+import sys
+import time
+from typing import Any, Callable, List, Sequence, Tuple
+from pyfunccache.cache import RaiseLine, ResultLine, ReturnLine
+from pyfunccache.serialize import *
+
+def candidates() -> List[Tuple[str, Callable[[], Serializer[Any]]]]:
+    return [
+        ("pickle5", PickleSerializer[Any]),
+        ("msgpack", MsgpackSerializer[Any]),
+        ("pickle5+zlib", lambda: CompressingSerializer[Any](PickleSerializer[Any](), ZlibCodec())),
+        ("pickle5+zstd", lambda: CompressingSerializer[Any](PickleSerializer[Any](), ZstdCodec())),
+        ("pickle5+lz4", lambda: CompressingSerializer[Any](PickleSerializer[Any](), Lz4Codec())),
+        ("msgpack+zstd", lambda: CompressingSerializer[Any](MsgpackSerializer[Any](), ZstdCodec())),
+    ]
+
+def workloads() -> List[Tuple[str, ResultLine[Any]]]:
+    return [
+        ("small", ReturnLine[Any]((1, "abc", 2.5))),
+        ("records", ReturnLine[Any]([{"id": i, "name": f"user{i}", "tags": ["a", "b"]} for i in range(1000)])),
+        ("blob", ReturnLine[Any](bytes(range(256)) * 4096)),
+        ("exception", RaiseLine[Any](ValueError("boom", 123))),
+    ]
+
+def measure(s: Serializer[Any], line: ResultLine[Any], rounds: int) -> Tuple[float, float, int]:
+    data: bytes = s.dumps(line)
+    start: float = time.perf_counter()
+    for _ in range(rounds):
+        s.dumps(line)
+    middle: float = time.perf_counter()
+    for _ in range(rounds):
+        s.loads(data)
+    end: float = time.perf_counter()
+    return rounds / (middle - start), rounds / (end - middle), len(data)
+
+def main(argv: Sequence[str]) -> None:
+    rounds: int = int(argv[1]) if len(argv) > 1 else 1000
+    print(f"{'serializer':<14} {'workload':<10} {'dumps/s':>12} {'loads/s':>12} {'bytes':>10}")
+    for name, factory in candidates():
+        try:
+            s: Serializer[Any] = factory()
+        except ImportError as x:
+            print(f"{name:<14} skipped: {x}")
+            continue
+        for wname, line in workloads():
+            d, l, size = measure(s, line, rounds)
+            print(f"{name:<14} {wname:<10} {d:>12.0f} {l:>12.0f} {size:>10}")
+
+if __name__ == "__main__":
+    main(sys.argv)
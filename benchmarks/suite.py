@@ -0,0 +1,206 @@
+import argparse
+import datetime
+import gc
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from pyfunccache.cache import *
+from pyfunccache.memo import CallParams, MemoizedFunctionWrapper, memoize
+from pyfunccache.serialize import Serializer
+from benchmarks.harness import Result, dump, per_call
+from benchmarks import serialize_bench
+
+CacheFactory = Callable[[], Cache[CallParams, Any]]
+
+def caches() -> List[Tuple[str, CacheFactory]]:
+    return [
+        ("SimpleCache", SimpleCache[CallParams, Any]),
+        ("SyncCache", SyncCache[CallParams, Any]),
+        ("ThreadLocalCache", ThreadLocalCache[CallParams, Any]),
+        ("ConcurrentCache", ConcurrentCache[CallParams, Any]),
+        ("ExpiringCache", lambda: ExpiringCache[CallParams, Any](datetime.timedelta(hours = 1), ConcurrentCache[CallParams, Any]())),
+        ("SnapshotCache", SnapshotCache[CallParams, Any]),
+        ("GreedyDualSizeCache", lambda: GreedyDualSizeCache[CallParams, Any](1 << 40, ConcurrentCache[CallParams, Any]())),
+        ("NearCache", lambda: NearCache[CallParams, Any](1024)),
+    ]
+
+class Options:
+    def __init__(self, quick: bool, repeat: int) -> None:
+        self.quick: bool = quick
+        self.repeat: int = repeat
+        self.target: float = 0.01 if quick else 0.1
+        self.threads: Sequence[int] = (1, 4, 16) if quick else (1, 2, 4, 8, 16, 32)
+        self.ops: int = 5000 if quick else 50000
+        self.entries: int = 2000 if quick else 20000
+
+def memoized(factory: CacheFactory) -> MemoizedFunctionWrapper[Any]:
+    def identity(q: Any) -> Any:
+        return q
+    return memoize(identity, True, factory())
+
+def bench_latency(o: Options) -> List[Result]:
+    results: List[Result] = []
+    for name, factory in caches():
+        f: MemoizedFunctionWrapper[Any] = memoized(factory)
+        f(1)
+        key: CallParams = CallParams.create(None, (1, ), {})
+
+        def hit() -> None:
+            f(1)
+
+        def miss() -> None:
+            f.cache.forget(key)
+            f(1)
+
+        results.append(Result("latency", "hit", "s", per_call(hit, o.repeat, o.target), {"cache": name}))
+        results.append(Result("latency", "miss", "s", per_call(miss, o.repeat, o.target), {"cache": name}))
+    return results
+
+def bench_keys(o: Options) -> List[Result]:
+    class Owner:
+        pass
+
+    owner: Owner = Owner()
+    shapes: List[Tuple[str, Optional[object], Sequence[Any], Dict[str, Any]]] = [
+        ("no_args", None, (), {}),
+        ("scalars", None, (1, "a", 2.5), {}),
+        ("kwargs", None, (), {"a": 1, "b": "x", "c": None}),
+        ("nested", None, ((1, 2, (3, 4)), ), {"d": {"x": [1, 2], "y": {"z": 3}}}),
+        ("large_list", None, (), {"items": list(range(100))}),
+        ("method", owner, (1, 2), {"k": "v"}),
+    ]
+    results: List[Result] = []
+    for name, real_self, args, kwargs in shapes:
+        def create() -> None:
+            hash(CallParams.create(real_self, args, kwargs))
+        results.append(Result("keys", "create", "s", per_call(create, o.repeat, o.target), {"shape": name}))
+    return results
+
+def run_threads(threads: int, work: Callable[[int], None]) -> float:
+    barrier: threading.Barrier = threading.Barrier(threads + 1)
+
+    def worker(seed: int) -> None:
+        barrier.wait()
+        work(seed)
+
+    pool: List[threading.Thread] = [threading.Thread(target = worker, args = (t, )) for t in range(threads)]
+    for t in pool: t.start()
+    barrier.wait()
+    start: float = time.perf_counter()
+    for t in pool: t.join()
+    return time.perf_counter() - start
+
+def bench_contention(o: Options) -> List[Result]:
+    results: List[Result] = []
+    for name, factory in caches():
+        for threads in o.threads:
+            values: List[float] = []
+            for _ in range(o.repeat):
+                f: MemoizedFunctionWrapper[Any] = memoized(factory)
+                for key in range(256):
+                    f(key)
+
+                def work(seed: int) -> None:
+                    for j in range(o.ops):
+                        f((seed * 7919 + j) % 256)
+
+                values.append(threads * o.ops / run_threads(threads, work))
+            results.append(Result("contention", "hits", "ops/s", values, {"cache": name, "threads": threads}, True))
+    return results
+
+def bench_memory(o: Options) -> List[Result]:
+    results: List[Result] = []
+    for name, factory in caches():
+        values: List[float] = []
+        for _ in range(o.repeat):
+            f: MemoizedFunctionWrapper[Any] = memoized(factory)
+            gc.collect()
+            tracemalloc.start()
+            before: int = tracemalloc.get_traced_memory()[0]
+            for key in range(o.entries):
+                f(key)
+            gc.collect()
+            after: int = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            values.append((after - before) / o.entries)
+        results.append(Result("memory", "per_entry", "bytes", values, {"cache": name}))
+    return results
+
+def zipf_keys(universe: int, skew: float, count: int, seed: int) -> List[int]:
+    weights: List[float] = [1.0 / (k + 1) ** skew for k in range(universe)]
+    return random.Random(seed).choices(range(universe), weights = weights, k = count)
+
+def bench_zipf(o: Options) -> List[Result]:
+    results: List[Result] = []
+    universe: int = o.entries
+    for skew in (0.8, 1.0, 1.2):
+        keys: List[int] = zipf_keys(universe, skew, o.ops * 4, 42)
+        for fraction in (0.01, 0.1):
+            capacity: int = int(universe * fraction) * sys.getsizeof(universe)
+            rates: List[float] = []
+            speeds: List[float] = []
+            for _ in range(o.repeat):
+                f: MemoizedFunctionWrapper[Any] = memoize(lambda q: q, True, GreedyDualSizeCache[CallParams, Any](capacity, ConcurrentCache[CallParams, Any]()))
+                start: float = time.perf_counter()
+                for key in keys:
+                    f(key)
+                speeds.append(len(keys) / (time.perf_counter() - start))
+                rates.append(f.stats.hits / (f.stats.hits + f.stats.misses))
+            params: Dict[str, Any] = {"cache": "GreedyDualSizeCache", "skew": skew, "capacity": fraction}
+            results.append(Result("zipf", "hit_rate", "ratio", rates, params, True))
+            results.append(Result("zipf", "throughput", "ops/s", speeds, params, True))
+    return results
+
+def bench_serialize(o: Options) -> List[Result]:
+    results: List[Result] = []
+    for name, factory in serialize_bench.candidates():
+        try:
+            s: Serializer[Any] = factory()
+        except ImportError:
+            continue
+        for wname, line in serialize_bench.workloads():
+            data: bytes = s.dumps(line)
+
+            def dumps() -> None:
+                s.dumps(line)
+
+            def loads() -> None:
+                s.loads(data)
+
+            params: Dict[str, Any] = {"serializer": name, "workload": wname}
+            results.append(Result("serialize", "dumps", "s", per_call(dumps, o.repeat, o.target), params))
+            results.append(Result("serialize", "loads", "s", per_call(loads, o.repeat, o.target), params))
+            results.append(Result("serialize", "size", "bytes", [float(len(data))], params))
+    return results
+
+GROUPS: Dict[str, Callable[[Options], List[Result]]] = {
+    "latency": bench_latency,
+    "keys": bench_keys,
+    "contention": bench_contention,
+    "memory": bench_memory,
+    "zipf": bench_zipf,
+    "serialize": bench_serialize,
+}
+
+def main(argv: Sequence[str]) -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description = "Run the pyfunccache benchmark suite.")
+    parser.add_argument("--json", help = "write machine-readable results to this file")
+    parser.add_argument("--only", nargs = "+", choices = sorted(GROUPS), help = "run only these groups")
+    parser.add_argument("--quick", action = "store_true", help = "smaller workloads, for smoke runs")
+    parser.add_argument("--repeat", type = int, default = 5)
+    args: argparse.Namespace = parser.parse_args(argv)
+
+    o: Options = Options(args.quick, args.repeat)
+    results: List[Result] = []
+    for group in args.only or GROUPS:
+        for r in GROUPS[group](o):
+            print(f"{r.key:<90} {r.median:>14.6g} {r.unit}")
+            results.append(r)
+    if args.json:
+        dump(results, args.json)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,3 +1,3 @@
 pip install ./ --upgrade
-mypy --disallow-untyped-defs --disallow-untyped-calls --disallow-incomplete-defs --check-untyped-defs --disallow-untyped-decorators --strict --show-traceback pyfunccache/memo.py pyfunccache/cache.py tests/cache_test.py tests/memo_test.py
+mypy --disallow-untyped-defs --disallow-untyped-calls --disallow-incomplete-defs --check-untyped-defs --disallow-untyped-decorators --strict --show-traceback pyfunccache/memo.py pyfunccache/cache.py pyfunccache/freeze.py pyfunccache/deps.py pyfunccache/serialize.py pyfunccache/stream.py pyfunccache/profiling.py pyfunccache/bus.py tests/conftest.py tests/cache_test.py tests/memo_test.py tests/deps_test.py tests/serialize_test.py tests/stream_test.py tests/profiling_test.py tests/bus_test.py
 pytest
\ No newline at end of file
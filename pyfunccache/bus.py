@@ -0,0 +1,383 @@
+import collections
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Deque, Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
+from .cache import Cache, ResultLine
+from .memo import CallParams
+
+K = TypeVar("K")
+V = TypeVar("V")
+X = TypeVar("X")
+
+Message = Tuple[str, str, Any]
+
+FORGET: str = "forget"
+RESET: str = "reset"
+TAG: str = "tag"
+
+class DeliveryError(OSError):
+    def __init__(self, failures: Dict[str, OSError]) -> None:
+        super().__init__(f"Could not deliver to {len(failures)} subscriber(s): {', '.join(sorted(failures))}.")
+        self.failures: Dict[str, OSError] = failures
+
+class Transport(ABC):
+    @abstractmethod
+    def send(self, payload: bytes) -> None:
+        pass
+
+    def send_to(self, peer: str, payload: bytes) -> None:
+        # Transports that cannot address a single subscriber send to all of them, which is merely redundant.
+        self.send(payload)
+
+    @abstractmethod
+    def receive(self, timeout: float) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    @property
+    def max_payload(self) -> Optional[int]:
+        return None
+
+class LocalHub:
+    def __init__(self) -> None:
+        self.__lock: threading.Lock = threading.Lock()
+        self.__subscribers: List[LocalTransport] = []
+
+    def transport(self) -> "LocalTransport":
+        t: LocalTransport = LocalTransport(self)
+        with self.__lock:
+            self.__subscribers.append(t)
+        return t
+
+    def publish(self, payload: bytes) -> None:
+        with self.__lock:
+            subscribers: List[LocalTransport] = list(self.__subscribers)
+        for t in subscribers:
+            t.deliver(payload)
+
+    def leave(self, t: "LocalTransport") -> None:
+        with self.__lock:
+            if t in self.__subscribers:
+                self.__subscribers.remove(t)
+
+class LocalTransport(Transport):
+    def __init__(self, hub: LocalHub) -> None:
+        self.__hub: LocalHub = hub
+        self.__inbox: queue.Queue[bytes] = queue.Queue()
+
+    def deliver(self, payload: bytes) -> None:
+        self.__inbox.put(payload)
+
+    def send(self, payload: bytes) -> None:
+        self.__hub.publish(payload)
+
+    def receive(self, timeout: float) -> Optional[bytes]:
+        try:
+            return self.__inbox.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.__hub.leave(self)
+
+class UnixSocketTransport(Transport):
+    MAX_DATAGRAM: int = 60000
+
+    def __init__(self, directory: str) -> None:
+        # Every subscriber binds one datagram socket in a shared private directory; publishing sends to each socket found there.
+        os.makedirs(directory, mode = 0o700, exist_ok = True)
+        # Payloads are unpickled, so a directory that somebody else owns or can write into would let them run code here.
+        st: os.stat_result = os.stat(directory)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077 != 0:
+            raise PermissionError(f"{directory!r} must be owned by the current user and not accessible by anyone else.")
+        self.__directory: str = directory
+        self.__path: str = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex}.sock")
+        self.__socket: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.__socket.bind(self.__path)
+        self.__sender: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.__sender.setblocking(False)
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def max_payload(self) -> Optional[int]:
+        return UnixSocketTransport.MAX_DATAGRAM
+
+    def send(self, payload: bytes) -> None:
+        failures: Dict[str, OSError] = {}
+        for name in os.listdir(self.__directory):
+            if name.endswith(".sock"):
+                self.__send_one(os.path.join(self.__directory, name), payload, failures)
+        if failures:
+            raise DeliveryError(failures)
+
+    def send_to(self, peer: str, payload: bytes) -> None:
+        failures: Dict[str, OSError] = {}
+        self.__send_one(peer, payload, failures)
+        if failures:
+            raise DeliveryError(failures)
+
+    def __send_one(self, path: str, payload: bytes, failures: Dict[str, OSError]) -> None:
+        try:
+            self.__sender.sendto(payload, path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The subscriber died without cleaning up after itself.
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        except OSError as x:
+            # A peer that is too far behind to accept more datagrams misses this batch rather than stalling everyone else.
+            failures[path] = x
+
+    def receive(self, timeout: float) -> Optional[bytes]:
+        self.__socket.settimeout(timeout)
+        try:
+            return self.__socket.recv(UnixSocketTransport.MAX_DATAGRAM + 1)
+        except socket.timeout:
+            return None
+
+    def close(self) -> None:
+        self.__socket.close()
+        self.__sender.close()
+        try:
+            os.unlink(self.__path)
+        except FileNotFoundError:
+            pass
+
+class InvalidationBus:
+    RETRY_INTERVAL: float = 0.05
+    MAX_RETRY_INTERVAL: float = 5.0
+    MAX_ERRORS: int = 100
+
+    def __init__(self, transport: Transport, flush_interval: float = 0.002, max_batch: int = 256) -> None:
+        self.__transport: Transport = transport
+        self.__flush_interval: float = flush_interval
+        self.__max_batch: int = max_batch
+        self.__id: str = uuid.uuid4().hex
+        self.__caches: Dict[str, Cache[Any, Any]] = {}
+        self.__pending: List[Message] = []
+        self.__condition: threading.Condition = threading.Condition()
+        self.__closed: bool = False
+        # Peers that missed a batch, with when to next send them a reset and the backoff after that; None stands for unknown peers.
+        self.__lagging: Dict[Optional[str], Tuple[float, float]] = {}
+        self.__errors: Deque[BaseException] = collections.deque(maxlen = InvalidationBus.MAX_ERRORS)
+        self.__listener: threading.Thread = threading.Thread(target = self.__listen, name = "pyfunccache-bus-listener", daemon = True)
+        self.__flusher: threading.Thread = threading.Thread(target = self.__flush_loop, name = "pyfunccache-bus-flusher", daemon = True)
+        self.__listener.start()
+        self.__flusher.start()
+
+    @property
+    def errors(self) -> List[BaseException]:
+        return list(self.__errors)
+
+    def attach(self, name: str, cache: Cache[K, V]) -> "BroadcastCache[K, V]":
+        with self.__condition:
+            if name in self.__caches:
+                raise ValueError(f"A cache named {name!r} is already attached.")
+            self.__caches[name] = cache
+        return BroadcastCache[K, V](cache, self, name)
+
+    def publish(self, name: str, op: str, arg: Any = None) -> None:
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__pending.append((name, op, arg))
+            self.__condition.notify()
+
+    def flush(self) -> None:
+        with self.__condition:
+            batch: List[Message] = self.__pending
+            self.__pending = []
+            now: float = time.monotonic()
+            due: List[Tuple[Optional[str], Tuple[float, float]]] = [(peer, entry) for peer, entry in self.__lagging.items() if entry[0] <= now]
+            resets: List[Message] = [(name, RESET, None) for name in self.__caches]
+        self.__send(batch)
+        # A peer that missed a batch cannot tell which keys it lost, so only that peer is told to reset every cache.
+        for peer, entry in due:
+            if self.__send(resets, peer):
+                with self.__condition:
+                    if self.__lagging.get(peer) == entry:
+                        del self.__lagging[peer]
+
+    def close(self) -> None:
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__condition.notify()
+        self.__flusher.join()
+        self.flush()
+        self.__listener.join()
+        self.__transport.close()
+
+    def __enter__(self) -> "InvalidationBus":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __flush_loop(self) -> None:
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    retry: Optional[float] = min((at for at, _ in self.__lagging.values()), default = None)
+                    if retry is not None and retry <= time.monotonic():
+                        break
+                    self.__condition.wait(None if retry is None else retry - time.monotonic())
+                if self.__closed:
+                    return
+                # Wait briefly so a burst of invalidations shares one message, unless the batch is already full.
+                deadline: float = time.monotonic() + self.__flush_interval
+                while len(self.__pending) < self.__max_batch and not self.__closed:
+                    remaining: float = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+            self.flush()
+
+    def __send(self, batch: List[Message], peer: Optional[str] = None) -> bool:
+        sent: bool = True
+        for start in range(0, len(batch), self.__max_batch):
+            sent = self.__send_chunk(batch[start:start + self.__max_batch], peer) and sent
+        return sent
+
+    def __send_chunk(self, chunk: List[Message], peer: Optional[str]) -> bool:
+        if not chunk:
+            return True
+        payload: Optional[bytes] = self.__encode(chunk)
+        limit: Optional[int] = self.__transport.max_payload
+        if payload is None or (limit is not None and len(payload) > limit):
+            if len(chunk) > 1:
+                half: int = len(chunk) // 2
+                first: bool = self.__send_chunk(chunk[:half], peer)
+                return self.__send_chunk(chunk[half:], peer) and first
+            # A key that cannot be pickled or is too large to ship is widened to a reset of its whole cache, which is always safe.
+            payload = self.__encode([(chunk[0][0], RESET, None)])
+            if payload is None:
+                return True
+        try:
+            if peer is None:
+                self.__transport.send(payload)
+            else:
+                self.__transport.send_to(peer, payload)
+            return True
+        except DeliveryError as x:
+            self.__errors.append(x)
+            self.__lag(x.failures)
+        except OSError as x:
+            self.__errors.append(x)
+            self.__lag([peer])
+        with self.__condition:
+            return peer not in self.__lagging
+
+    def __lag(self, peers: Iterable[Optional[str]]) -> None:
+        with self.__condition:
+            now: float = time.monotonic()
+            for peer in peers:
+                # A peer already waiting for its retry keeps it; once that retry fails too, the next one backs off exponentially.
+                at, delay = self.__lagging.get(peer, (now, InvalidationBus.RETRY_INTERVAL / 2))
+                if at > now:
+                    continue
+                delay = min(delay * 2, InvalidationBus.MAX_RETRY_INTERVAL)
+                self.__lagging[peer] = (now + delay, delay)
+            self.__condition.notify()
+
+    def __encode(self, chunk: List[Message]) -> Optional[bytes]:
+        try:
+            return pickle.dumps((self.__id, chunk), protocol = pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return None
+
+    def __listen(self) -> None:
+        while not self.__closed:
+            try:
+                payload: Optional[bytes] = self.__transport.receive(0.05)
+            except OSError as x:
+                if self.__closed: return
+                self.__errors.append(x)
+                continue
+            if payload is None:
+                continue
+            try:
+                self.__apply(payload)
+            except Exception as x:
+                self.__errors.append(x)
+
+    def __apply(self, payload: bytes) -> None:
+        # Payloads are unpickled, so the transport must only be reachable by trusted processes.
+        sender, messages = pickle.loads(payload)
+        if sender == self.__id:
+            return
+        for name, op, arg in messages:
+            cache: Optional[Cache[Any, Any]] = self.__caches.get(name)
+            if cache is None:
+                continue
+            if op == FORGET:
+                cache.forget(arg)
+            elif op == RESET:
+                cache.reset()
+            elif op == TAG:
+                cache.invalidate_tag(arg)
+
+def _portable(key: Any) -> bool:
+    # Keys arrive unpickled as copies, so a method's receiver that compares by identity would never match anything remotely.
+    if not isinstance(key, CallParams) or key.real_self is None:
+        return True
+    t: Any = type(key.real_self)
+    return t.__eq__ is not object.__eq__ and t.__hash__ is not object.__hash__
+
+class BroadcastCache(Cache[K, V], Generic[K, V]):
+    def __init__(self, delegate: Cache[K, V], bus: InvalidationBus, name: str) -> None:
+        self.__delegate: Cache[K, V] = delegate
+        self.__bus: InvalidationBus = bus
+        self.__name: str = name
+
+    @property
+    def delegate(self) -> Cache[K, V]:
+        return self.__delegate
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def shared(self) -> bool:
+        return self.__delegate.shared
+
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return self.__delegate.is_live(line)
+
+    def reset(self) -> None:
+        self.__delegate.reset()
+        self.__bus.publish(self.__name, RESET)
+
+    def add_line(self, key: K, line: ResultLine[V]) -> None:
+        replaced: bool = not line.empty and not self.__delegate.get_line(key).empty
+        self.__delegate.add_line(key, line)
+        if line.empty or replaced:
+            if _portable(key):
+                self.__bus.publish(self.__name, FORGET, key)
+            else:
+                self.__bus.publish(self.__name, RESET)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        self.__delegate.invalidate_tag(tag)
+        self.__bus.publish(self.__name, TAG, tag)
+
+    def get_line(self, key: K) -> ResultLine[V]:
+        return self.__delegate.get_line(key)
+
+    def with_line(self, key: K, what: Callable[[ResultLine[V]], X]) -> X:
+        return self.__delegate.with_line(key, what)
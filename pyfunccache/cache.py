@@ -1,8 +1,13 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 import datetime
+import heapq
+import itertools
+import sys
 import threading
 from abc import ABC, abstractmethod
-from typing import Callable, cast, Dict, Generic, Iterator, Optional, Sequence, Tuple, Type, TypeVar
+from typing import AbstractSet, Any, Callable, cast, Collection, Dict, FrozenSet, Generic, Hashable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type, TypeVar
 from dataclasses import dataclass
 
 K = TypeVar("K")
@@ -10,6 +15,42 @@ V = TypeVar("V")
 T = TypeVar("T")
 X = TypeVar("X")
 
+_ATOMS: Tuple[type, ...] = (str, bytes, bytearray, memoryview, int, float, complex, bool, type(None), range, type)
+
+def deep_size(value: object, budget: int = 10000) -> int:
+    # sys.getsizeof only counts the outer object, so containers are walked too. Once the budget of visited objects
+    # runs out, the rest of each container is estimated from the average size of the items already measured.
+    return _deep_size(value, set(), [budget])
+
+def _deep_size(value: object, seen: Set[int], budget: List[int]) -> int:
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size: int = sys.getsizeof(value)
+    if isinstance(value, _ATOMS):
+        return size
+    items: Collection[Any]
+    if isinstance(value, dict):
+        items = [x for kv in value.items() for x in kv]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    elif isinstance(value, BaseException):
+        items = (value.args, getattr(value, '__dict__', None))
+    elif hasattr(value, '__dict__'):
+        items = (value.__dict__, )
+    else:
+        return size
+    measured: int = 0
+    count: int = 0
+    for item in items:
+        if budget[0] <= 0:
+            size += (measured // count if count else 0) * (len(items) - count)
+            break
+        budget[0] -= 1
+        measured += _deep_size(item, seen, budget)
+        count += 1
+    return size + measured
+
 class ResultLine(ABC, Generic[T]):
     def __init__(self) -> None:
         pass
@@ -29,6 +70,30 @@ class ResultLine(ABC, Generic[T]):
     def result(self) -> T:
         pass
 
+    @property
+    @abstractmethod
+    def cost(self) -> float:
+        pass
+
+    @property
+    @abstractmethod
+    def size(self) -> int:
+        pass
+
+    @property
+    @abstractmethod
+    def expires(self) -> Optional[datetime.datetime]:
+        pass
+
+    @property
+    @abstractmethod
+    def tags(self) -> FrozenSet[Hashable]:
+        pass
+
+    def expired(self, now: Optional[datetime.datetime] = None) -> bool:
+        e: Optional[datetime.datetime] = self.expires
+        return e is not None and e <= (datetime.datetime.now() if now is None else now)
+
 class EmptyLine(ResultLine[T], Generic[T]):
     def __init__(self) -> None:
         pass
@@ -45,13 +110,34 @@ class EmptyLine(ResultLine[T], Generic[T]):
     def result(self) -> T:
         raise KeyError()
 
+    @property
+    def cost(self) -> float:
+        return 0.0
+
+    @property
+    def size(self) -> int:
+        return 0
+
+    @property
+    def expires(self) -> Optional[datetime.datetime]:
+        return None
+
+    @property
+    def tags(self) -> FrozenSet[Hashable]:
+        return frozenset()
+
     def __eq__(self, other: object) -> bool:
         return type(other) == EmptyLine
 
 class RaiseLine(ResultLine[T], Generic[T]):
-    def __init__(self, raised: BaseException) -> None:
+    def __init__(self, raised: BaseException, updated: Optional[datetime.datetime] = None, cost: float = 0.0, size: Optional[int] = None, expires: Optional[datetime.datetime] = None, failures: int = 1, tags: Iterable[Hashable] = ()) -> None:
         self.__raised: BaseException = raised
-        self.__updated: datetime.datetime = datetime.datetime.now()
+        self.__updated: datetime.datetime = datetime.datetime.now() if updated is None else updated
+        self.__cost: float = cost
+        self.__size: Optional[int] = size
+        self.__expires: Optional[datetime.datetime] = expires
+        self.__failures: int = failures
+        self.__tags: FrozenSet[Hashable] = frozenset(tags)
 
     @property
     def updated(self) -> datetime.datetime:
@@ -65,13 +151,43 @@ class RaiseLine(ResultLine[T], Generic[T]):
     def result(self) -> T:
         raise self.__raised
 
+    @property
+    def raised(self) -> BaseException:
+        return self.__raised
+
+    @property
+    def cost(self) -> float:
+        return self.__cost
+
+    @property
+    def size(self) -> int:
+        if self.__size is None:
+            self.__size = deep_size(self.__raised)
+        return self.__size
+
+    @property
+    def expires(self) -> Optional[datetime.datetime]:
+        return self.__expires
+
+    @property
+    def failures(self) -> int:
+        return self.__failures
+
+    @property
+    def tags(self) -> FrozenSet[Hashable]:
+        return self.__tags
+
     def __eq__(self, other: object) -> bool:
         return type(other) == RaiseLine and cast(RaiseLine[T], other).__updated == self.__updated and cast(RaiseLine[T], other).__raised == self.__raised
 
 class ReturnLine(ResultLine[T], Generic[T]):
-    def __init__(self, returned: T) -> None:
+    def __init__(self, returned: T, updated: Optional[datetime.datetime] = None, cost: float = 0.0, size: Optional[int] = None, expires: Optional[datetime.datetime] = None, tags: Iterable[Hashable] = ()) -> None:
         self.__returned: T = returned
-        self.__updated: datetime.datetime = datetime.datetime.now()
+        self.__updated: datetime.datetime = datetime.datetime.now() if updated is None else updated
+        self.__cost: float = cost
+        self.__size: Optional[int] = size
+        self.__expires: Optional[datetime.datetime] = expires
+        self.__tags: FrozenSet[Hashable] = frozenset(tags)
 
     @property
     def updated(self) -> datetime.datetime:
@@ -85,10 +201,62 @@ class ReturnLine(ResultLine[T], Generic[T]):
     def result(self) -> T:
         return self.__returned
 
+    @property
+    def cost(self) -> float:
+        return self.__cost
+
+    @property
+    def size(self) -> int:
+        # Measured on first use, since only size-aware caches and serializers need it and walking a big result is not free.
+        if self.__size is None:
+            self.__size = deep_size(self.__returned)
+        return self.__size
+
+    @property
+    def expires(self) -> Optional[datetime.datetime]:
+        return self.__expires
+
+    @property
+    def tags(self) -> FrozenSet[Hashable]:
+        return self.__tags
+
     def __eq__(self, other: object) -> bool:
         return type(other) == ReturnLine and cast(ReturnLine[T], other).__updated == self.__updated and cast(ReturnLine[T], other).__returned == self.__returned
 
+class TagIndex(Generic[K]):
+    def __init__(self) -> None:
+        self.__keys: Dict[Hashable, Set[K]] = {}
+        self.__tags: Dict[K, Set[Hashable]] = {}
+
+    def add(self, key: K, tags: AbstractSet[Hashable]) -> None:
+        # Overwriting a key replaces its tags, so a tag only the old line carried cannot invalidate the new one.
+        self.discard(key)
+        if not tags: return
+        self.__tags[key] = set(tags)
+        for tag in tags:
+            self.__keys.setdefault(tag, set()).add(key)
+
+    def discard(self, key: K) -> None:
+        for tag in self.__tags.pop(key, ()):
+            keys: Set[K] = self.__keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self.__keys[tag]
+
+    def pop(self, tag: Hashable) -> List[K]:
+        keys: List[K] = list(self.__keys.get(tag, ()))
+        for key in keys:
+            self.discard(key)
+        return keys
+
+    def __len__(self) -> int:
+        return len(self.__tags)
+
 class Cache(ABC, Generic[K, V]):
+    @property
+    def shared(self) -> bool:
+        return True
+
     @abstractmethod
     def reset(self) -> None:
         pass
@@ -100,15 +268,23 @@ class Cache(ABC, Generic[K, V]):
     def forget(self, key: K) -> None:
         self.add_line(key, EmptyLine[V]())
 
-    def save(self, key: K, value: V) -> None:
-        self.add_line(key, ReturnLine[V](value))
+    @abstractmethod
+    def invalidate_tag(self, tag: Hashable) -> None:
+        pass
+
+    def save(self, key: K, value: V, cost: float = 0.0) -> None:
+        self.add_line(key, ReturnLine[V](value, cost = cost))
 
-    def save_exception(self, key: K, ouch: BaseException) -> None:
-        self.add_line(key, RaiseLine[V](ouch))
+    def save_exception(self, key: K, ouch: BaseException, cost: float = 0.0) -> None:
+        self.add_line(key, RaiseLine[V](ouch, cost = cost))
 
     def has_cached(self, key: K) -> bool:
         return not self.get_line(key).empty
 
+    # Whether a line handed out earlier would still be served now; used by layers that keep their own copies.
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return not line.expired()
+
     def get_cached(self, key: K) -> V:
         return self.get_line(key).result
 
@@ -126,15 +302,23 @@ class Cache(ABC, Generic[K, V]):
 class SimpleCache(Cache[K, V], Generic[K, V]):
     def __init__(self) -> None:
         self.__memo: Dict[K, ResultLine[V]] = {}
+        self.__tags: TagIndex[K] = TagIndex[K]()
 
     def reset(self) -> None:
         self.__memo = {}
+        self.__tags = TagIndex[K]()
 
     def add_line(self, key: K, line: ResultLine[V]) -> None:
         if not line.empty:
             self.__memo[key] = line
+            self.__tags.add(key, line.tags)
         elif key in self.__memo:
             del self.__memo[key]
+            self.__tags.discard(key)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        for key in self.__tags.pop(tag):
+            self.__memo.pop(key, None)
 
     def get_line(self, key: K) -> ResultLine[V]:
         if key not in self.__memo:
@@ -148,21 +332,42 @@ class SimpleCache(Cache[K, V], Generic[K, V]):
 class ThreadLocalCache(Cache[K, V], Generic[K, V]):
     def __init__(self) -> None:
         self.__memo: threading.local = threading.local()
+        self.__epochs: Iterator[int] = itertools.count()
+        self.__epoch: int = next(self.__epochs)
+
+    @property
+    def shared(self) -> bool:
+        return False
 
     def reset(self) -> None:
-        self.__memo.t = {}
+        # Other threads cannot be reached directly, so they notice the new epoch and drop their dicts on their next access.
+        self.__epoch = next(self.__epochs)
 
     def __ensure_t(self) -> Dict[K, ResultLine[V]]:
-        if not hasattr(self.__memo, 't'):
+        epoch: int = self.__epoch
+        if getattr(self.__memo, 'epoch', None) != epoch:
             self.__memo.t = {}
+            self.__memo.tags = TagIndex[K]()
+            self.__memo.epoch = epoch
         return cast(Dict[K, ResultLine[V]], self.__memo.t)
 
+    def __ensure_tags(self) -> TagIndex[K]:
+        self.__ensure_t()
+        return cast(TagIndex[K], self.__memo.tags)
+
     def add_line(self, key: K, line: ResultLine[V]) -> None:
         t: Dict[K, ResultLine[V]] = self.__ensure_t()
         if not line.empty:
             t[key] = line
+            self.__ensure_tags().add(key, line.tags)
         elif key in t:
             del t[key]
+            self.__ensure_tags().discard(key)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        t: Dict[K, ResultLine[V]] = self.__ensure_t()
+        for key in self.__ensure_tags().pop(tag):
+            t.pop(key, None)
 
     def get_line(self, key: K) -> ResultLine[V]:
         t: Dict[K, ResultLine[V]] = self.__ensure_t()
@@ -188,6 +393,10 @@ class SyncCache(Cache[K, V], Generic[K, V]):
         with self.__full_lock:
             self.__delegate.add_line(key, line)
 
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self.__full_lock:
+            self.__delegate.invalidate_tag(tag)
+
     def get_line(self, key: K) -> ResultLine[V]:
         with self.__full_lock:
             return self.__delegate.get_line(key)
@@ -196,6 +405,76 @@ class SyncCache(Cache[K, V], Generic[K, V]):
         with self.__full_lock:
             return self.__delegate.for_each_line()'''
 
+class SnapshotCache(Cache[K, V], Generic[K, V]):
+    # Suited to read-mostly use after warm-up. Readers take one reference to an immutable (snapshot, overlay) pair
+    # and never lock. Writers add to the overlay in place. The overlay is only merged into a fresh snapshot once it
+    # outgrows a fraction of the snapshot, so a write costs O(1) amortized instead of a full copy.
+    MIN_OVERLAY: int = 64
+
+    def __init__(self) -> None:
+        self.__write_lock: threading.RLock = threading.RLock()
+        self.__state: Tuple[Dict[K, ResultLine[V]], Dict[K, ResultLine[V]]] = ({}, {})
+        self.__batches: int = 0
+        self.__empty: ResultLine[V] = EmptyLine[V]()
+        self.__tags: TagIndex[K] = TagIndex[K]()
+
+    def reset(self) -> None:
+        with self.__write_lock:
+            self.__state = ({}, {})
+            self.__tags = TagIndex[K]()
+
+    def add_line(self, key: K, line: ResultLine[V]) -> None:
+        with self.__write_lock:
+            if line.empty:
+                self.__tags.discard(key)
+            else:
+                self.__tags.add(key, line.tags)
+            self.__write({key: line})
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self.__write_lock:
+            self.__write({key: self.__empty for key in self.__tags.pop(tag)})
+
+    def __write(self, changes: Dict[K, ResultLine[V]]) -> None:
+        snapshot, overlay = self.__state
+        # Empty lines stay in the overlay as tombstones that hide the snapshot's entry until the next merge.
+        overlay.update(changes)
+        if self.__batches == 0 and len(overlay) > max(SnapshotCache.MIN_OVERLAY, len(snapshot) // 4):
+            self.__merge()
+
+    def __merge(self) -> None:
+        snapshot, overlay = self.__state
+        if not overlay:
+            return
+        new: Dict[K, ResultLine[V]] = dict(snapshot)
+        for key, line in overlay.items():
+            if not line.empty:
+                new[key] = line
+            else:
+                new.pop(key, None)
+        self.__state = (new, {})
+
+    def get_line(self, key: K) -> ResultLine[V]:
+        snapshot, overlay = self.__state
+        if overlay:
+            line: Optional[ResultLine[V]] = overlay.get(key)
+            if line is not None:
+                return line
+        return snapshot.get(key, self.__empty)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # Writes inside a batch are visible at once; the batch only postpones merging until it closes.
+        with self.__write_lock:
+            self.__batches += 1
+        try:
+            yield
+        finally:
+            with self.__write_lock:
+                self.__batches -= 1
+                if self.__batches == 0:
+                    self.__merge()
+
 class ConcurrentMutableResultLine(Generic[V]):
     def __init__(self) -> None:
         self.__lock: threading.RLock = threading.RLock()
@@ -219,10 +498,12 @@ class ConcurrentCache(Cache[K, V], Generic[K, V]):
     def __init__(self) -> None:
         self.__full_lock: threading.RLock = threading.RLock()
         self.__memo: Dict[K, ConcurrentMutableResultLine[V]] = {}
+        self.__tags: TagIndex[K] = TagIndex[K]()
 
     def reset(self) -> None:
         with self.__full_lock:
             self.__memo = {}
+            self.__tags = TagIndex[K]()
 
     def __ensure_line(self, key: K) -> ConcurrentMutableResultLine[V]:
         with self.__full_lock:
@@ -231,7 +512,22 @@ class ConcurrentCache(Cache[K, V], Generic[K, V]):
             return self.__memo[key]
 
     def add_line(self, key: K, line: ResultLine[V]) -> None:
-        self.__ensure_line(key).line = line
+        if line.empty:
+            with self.__full_lock:
+                self.__memo.pop(key, None)
+                self.__tags.discard(key)
+        else:
+            # The tags are indexed together with fetching the holder, before the line becomes visible. An invalidate_tag
+            # that runs before the line is set pops this same holder, so the line lands in a detached holder nobody reads.
+            with self.__full_lock:
+                self.__tags.add(key, line.tags)
+                holder: ConcurrentMutableResultLine[V] = self.__ensure_line(key)
+            holder.line = line
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self.__full_lock:
+            for key in self.__tags.pop(tag):
+                self.__memo.pop(key, None)
 
     def get_line(self, key: K) -> ResultLine[V]:
         return self.__ensure_line(key).line
@@ -244,17 +540,104 @@ class ConcurrentCache(Cache[K, V], Generic[K, V]):
             for k in self.__memo:
                 yield k, self.__memo[k].line'''
 
+class _NearSlot(Generic[K, V]):
+    def __init__(self, epoch: int) -> None:
+        self.epoch: int = epoch
+        self.lines: OrderedDict[K, ResultLine[V]] = OrderedDict()
+
+class NearCache(Cache[K, V], Generic[K, V]):
+    def __init__(self, capacity: int, delegate: Optional[Cache[K, V]] = None) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive.")
+        if delegate is None:
+            delegate = ConcurrentCache[K, V]()
+        self.__capacity: int = capacity
+        self.__delegate: Cache[K, V] = delegate
+        self.__local: threading.local = threading.local()
+        self.__epochs: Iterator[int] = itertools.count()
+        self.__epoch: int = next(self.__epochs)
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    @property
+    def delegate(self) -> Cache[K, V]:
+        return self.__delegate
+
+    @property
+    def shared(self) -> bool:
+        return self.__delegate.shared
+
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return self.__delegate.is_live(line)
+
+    def __slot(self) -> _NearSlot[K, V]:
+        # Slots live in a threading.local, so they are never shared, need no locks and die with their thread.
+        epoch: int = self.__epoch
+        slot: Optional[_NearSlot[K, V]] = getattr(self.__local, 'slot', None)
+        if slot is None or slot.epoch != epoch:
+            slot = _NearSlot[K, V](epoch)
+            self.__local.slot = slot
+        return slot
+
+    def __bump(self) -> None:
+        self.__epoch = next(self.__epochs)
+
+    def reset(self) -> None:
+        self.__delegate.reset()
+        self.__bump()
+
+    def add_line(self, key: K, line: ResultLine[V]) -> None:
+        replaced: bool = not line.empty and not self.__delegate.get_line(key).empty
+        self.__delegate.add_line(key, line)
+        if line.empty or replaced:
+            self.__bump()
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        self.__delegate.invalidate_tag(tag)
+        self.__bump()
+
+    def get_line(self, key: K) -> ResultLine[V]:
+        slot: _NearSlot[K, V] = self.__slot()
+        lines: OrderedDict[K, ResultLine[V]] = slot.lines
+        line: Optional[ResultLine[V]] = lines.get(key)
+        if line is not None:
+            if self.__delegate.is_live(line):
+                lines.move_to_end(key)
+                return line
+            del lines[key]
+        line = self.__delegate.get_line(key)
+        if not line.empty:
+            lines[key] = line
+            if len(lines) > self.__capacity:
+                lines.popitem(last = False)
+        return line
+
+    def local_size(self) -> int:
+        return len(self.__slot().lines)
+
 class ExpiringCache(Cache[K, V], Generic[K, V]):
     def __init__(self, expiration: datetime.timedelta, delegate: Cache[K, V]) -> None:
         self.__expiration = expiration
         self.__delegate = delegate
 
+    @property
+    def shared(self) -> bool:
+        return self.__delegate.shared
+
     def reset(self) -> None:
         self.__delegate.reset()
 
     def add_line(self, key: K, line: ResultLine[V]) -> None:
         self.__delegate.add_line(key, line)
 
+    def invalidate_tag(self, tag: Hashable) -> None:
+        self.__delegate.invalidate_tag(tag)
+
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return not self.__is_expired(line) and self.__delegate.is_live(line)
+
     def get_line(self, key: K) -> ResultLine[V]:
         line = self.__delegate.get_line(key)
         if not self.__is_expired(line): return line
@@ -268,4 +651,115 @@ class ExpiringCache(Cache[K, V], Generic[K, V]):
 
     def __is_expired(self, line: ResultLine[V]) -> bool:
         u: Optional[datetime.datetime] = line.updated
-        return u is None or u + self.__expiration < datetime.datetime.now()
\ No newline at end of file
+        return u is None or u + self.__expiration < datetime.datetime.now()
+
+class GreedyDualSizeCache(Cache[K, V], Generic[K, V]):
+    def __init__(self, capacity: int, delegate: Cache[K, V]) -> None:
+        self.__capacity: int = capacity
+        self.__delegate: Cache[K, V] = delegate
+        self.__lock: threading.RLock = threading.RLock()
+        self.__inflation: float = 0.0
+        self.__used: int = 0
+        self.__entries: Dict[K, Tuple[float, int, int]] = {}
+        self.__heap: List[Tuple[float, int, K]] = []
+        self.__counter: Iterator[int] = itertools.count()
+        self.__tags: TagIndex[K] = TagIndex[K]()
+
+    @property
+    def shared(self) -> bool:
+        return self.__delegate.shared
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return self.__delegate.is_live(line)
+
+    @property
+    def heap_size(self) -> int:
+        with self.__lock:
+            return len(self.__heap)
+
+    @property
+    def used(self) -> int:
+        with self.__lock:
+            return self.__used
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__inflation = 0.0
+            self.__used = 0
+            self.__entries = {}
+            self.__heap = []
+            self.__tags = TagIndex[K]()
+        self.__delegate.reset()
+
+    def add_line(self, key: K, line: ResultLine[V]) -> None:
+        self.__delegate.add_line(key, line)
+        with self.__lock:
+            self.__untrack(key)
+            if line.empty:
+                self.__tags.discard(key)
+            else:
+                self.__track(key, line)
+                self.__tags.add(key, line.tags)
+            victims: List[K] = self.__evict()
+        for victim in victims:
+            self.__delegate.forget(victim)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self.__lock:
+            victims: List[K] = self.__tags.pop(tag)
+            for victim in victims:
+                self.__untrack(victim)
+        for victim in victims:
+            self.__delegate.forget(victim)
+
+    def get_line(self, key: K) -> ResultLine[V]:
+        line: ResultLine[V] = self.__delegate.get_line(key)
+        self.__touch(key, line)
+        return line
+
+    def with_line(self, key: K, what: Callable[[ResultLine[V]], X]) -> X:
+        def inner(line: ResultLine[V]) -> X:
+            self.__touch(key, line)
+            return what(line)
+        return self.__delegate.with_line(key, inner)
+
+    def __touch(self, key: K, line: ResultLine[V]) -> None:
+        if line.empty: return
+        with self.__lock:
+            entry: Optional[Tuple[float, int, int]] = self.__entries.get(key)
+            # Until something is evicted the inflation stays put, so a hit usually leaves the priority unchanged.
+            if entry is not None and entry[0] != self.__inflation + line.cost / max(line.size, 1):
+                self.__untrack(key)
+                self.__track(key, line)
+
+    def __track(self, key: K, line: ResultLine[V]) -> None:
+        size: int = max(line.size, 1)
+        priority: float = self.__inflation + line.cost / size
+        stamp: int = next(self.__counter)
+        self.__entries[key] = (priority, stamp, size)
+        self.__used += size
+        heapq.heappush(self.__heap, (priority, stamp, key))
+        if len(self.__heap) > 2 * len(self.__entries) + 16:
+            self.__heap = [(p, s, k) for k, (p, s, _) in self.__entries.items()]
+            heapq.heapify(self.__heap)
+
+    def __untrack(self, key: K) -> None:
+        old: Optional[Tuple[float, int, int]] = self.__entries.pop(key, None)
+        if old is not None:
+            self.__used -= old[2]
+
+    def __evict(self) -> List[K]:
+        victims: List[K] = []
+        while self.__used > self.__capacity and self.__heap:
+            priority, stamp, key = heapq.heappop(self.__heap)
+            entry: Optional[Tuple[float, int, int]] = self.__entries.get(key)
+            if entry is None or entry[1] != stamp: continue
+            self.__inflation = priority
+            self.__untrack(key)
+            self.__tags.discard(key)
+            victims.append(key)
+        return victims
\ No newline at end of file
@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+import threading
+from typing import Any, Callable, cast, ContextManager, Dict, Generic, Hashable, Iterator, List, Set, Tuple, TypeVar
+from .cache import Cache, ResultLine, ReturnLine, TagIndex
+
+K = TypeVar("K")
+V = TypeVar("V")
+X = TypeVar("X")
+
+Node = Tuple[Cache[Any, Any], Any]
+
+class Computation:
+    def __init__(self, node: Node) -> None:
+        self.node: Node = node
+        self.stale: bool = False
+
+class DependencyGraph:
+    def __init__(self) -> None:
+        self.__lock: threading.RLock = threading.RLock()
+        self.__dependents: Dict[Node, Set[Node]] = {}
+        self.__dependencies: Dict[Node, Set[Node]] = {}
+        self.__nodes: Dict[Cache[Any, Any], Set[Any]] = {}
+        self.__running: Dict[Node, List[Computation]] = {}
+        self.__stack: threading.local = threading.local()
+
+    def __ensure_stack(self) -> List[Computation]:
+        if not hasattr(self.__stack, 's'):
+            self.__stack.s = []
+        return cast(List[Computation], self.__stack.s)
+
+    def computing(self, node: Node) -> ContextManager[Computation]:
+        return self.__run(node, True)
+
+    def resuming(self, node: Node) -> ContextManager[Computation]:
+        # Like computing, but keeps the edges already recorded, for work that carries on after the first computation
+        # returned, such as pulling more items out of a memoized generator.
+        return self.__run(node, False)
+
+    @contextmanager
+    def __run(self, node: Node, fresh: bool) -> Iterator[Computation]:
+        c: Computation = Computation(node)
+        with self.__lock:
+            if fresh: self.__unlink(node)
+            self.__running.setdefault(node, []).append(c)
+        stack: List[Computation] = self.__ensure_stack()
+        stack.append(c)
+        try:
+            yield c
+        finally:
+            stack.pop()
+            with self.__lock:
+                running: List[Computation] = self.__running[node]
+                running.remove(c)
+                if not running:
+                    del self.__running[node]
+
+    def read(self, node: Node) -> None:
+        stack: List[Computation] = self.__ensure_stack()
+        if not stack: return
+        parent: Node = stack[-1].node
+        if parent == node: return
+        with self.__lock:
+            self.__dependents.setdefault(node, set()).add(parent)
+            self.__dependencies.setdefault(parent, set()).add(node)
+            self.__nodes.setdefault(node[0], set()).add(node[1])
+            self.__nodes.setdefault(parent[0], set()).add(parent[1])
+
+    def dependents(self, node: Node) -> Set[Node]:
+        with self.__lock:
+            return set(self.__dependents.get(node, ()))
+
+    def dependencies(self, node: Node) -> Set[Node]:
+        with self.__lock:
+            return set(self.__dependencies.get(node, ()))
+
+    def has_dependents(self, node: Node) -> bool:
+        with self.__lock:
+            return node in self.__dependents
+
+    def invalidate(self, node: Node, running: bool = True) -> None:
+        # With running=False, dependents that are computing right now are left alone: they read the node while it was
+        # empty and are about to use its new value, as happens when an outer call computes an inner one for the first time.
+        victims: List[Node] = []
+        with self.__lock:
+            pending: List[Node] = [node]
+            seen: Set[Node] = {node}
+            while pending:
+                n: Node = pending.pop()
+                for c in self.__running.get(n, ()):
+                    if n != node: c.stale = True
+                dependents: Set[Node] = self.__dependents.pop(n, set())
+                kept: Set[Node] = set() if running else {d for d in dependents if d in self.__running}
+                if kept:
+                    self.__dependents[n] = kept
+                for d in dependents - kept:
+                    self.__dependencies.get(d, set()).discard(n)
+                    if d not in seen:
+                        seen.add(d)
+                        victims.append(d)
+                        pending.append(d)
+                self.__forget_node(n)
+        for cache, key in victims:
+            cache.forget(key)
+
+    def discard(self, node: Node) -> None:
+        with self.__lock:
+            self.__unlink(node)
+
+    def nodes_of(self, cache: Cache[Any, Any]) -> List[Node]:
+        with self.__lock:
+            return [(cache, key) for key in self.__nodes.get(cache, ())]
+
+    def __unlink(self, node: Node) -> None:
+        for d in self.__dependencies.pop(node, ()):
+            dependents: Set[Node] = self.__dependents.get(d, set())
+            dependents.discard(node)
+            if not dependents:
+                self.__dependents.pop(d, None)
+                self.__forget_node(d)
+        self.__forget_node(node)
+
+    def __forget_node(self, node: Node) -> None:
+        if node in self.__dependents or node in self.__dependencies:
+            return
+        keys: Set[Any] = self.__nodes.get(node[0], set())
+        keys.discard(node[1])
+        if not keys:
+            self.__nodes.pop(node[0], None)
+
+class DependentCache(Cache[K, V], Generic[K, V]):
+    def __init__(self, delegate: Cache[K, V], graph: DependencyGraph) -> None:
+        self.__delegate: Cache[K, V] = delegate
+        self.__graph: DependencyGraph = graph
+        self.__lock: threading.Lock = threading.Lock()
+        self.__tags: TagIndex[K] = TagIndex[K]()
+
+    @property
+    def graph(self) -> DependencyGraph:
+        return self.__graph
+
+    @property
+    def shared(self) -> bool:
+        return self.__delegate.shared
+
+    def is_live(self, line: ResultLine[V]) -> bool:
+        return self.__delegate.is_live(line)
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__tags = TagIndex[K]()
+        self.__delegate.reset()
+        for node in self.__graph.nodes_of(self):
+            self.__graph.invalidate(node)
+            self.__graph.discard(node)
+
+    def add_line(self, key: K, line: ResultLine[V]) -> None:
+        node: Node = (self, key)
+        changed: bool = line.empty
+        refill: bool = False
+        if not line.empty and self.__graph.has_dependents(node):
+            old: ResultLine[V] = self.__delegate.get_line(key)
+            # An empty old line may have expired or been evicted underneath us, so dependents built on it are stale too.
+            refill = old.empty
+            changed = refill or DependentCache.__changed(old, line)
+        self.__delegate.add_line(key, line)
+        with self.__lock:
+            if line.empty:
+                self.__tags.discard(key)
+            else:
+                self.__tags.add(key, line.tags)
+        if changed:
+            self.__graph.invalidate(node, not refill)
+        if line.empty:
+            self.__graph.discard(node)
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        with self.__lock:
+            keys: List[K] = self.__tags.pop(tag)
+        for key in keys:
+            self.forget(key)
+
+    def get_line(self, key: K) -> ResultLine[V]:
+        self.__graph.read((self, key))
+        return self.__delegate.get_line(key)
+
+    def with_line(self, key: K, what: Callable[[ResultLine[V]], X]) -> X:
+        self.__graph.read((self, key))
+        return self.__delegate.with_line(key, what)
+
+    @staticmethod
+    def __changed(old: ResultLine[V], new: ResultLine[V]) -> bool:
+        if not isinstance(old, ReturnLine) or not isinstance(new, ReturnLine):
+            return True
+        try:
+            return not bool(old.result == new.result)
+        except Exception:
+            return True
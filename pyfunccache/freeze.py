@@ -0,0 +1,8 @@
+from typing import Any
+
+def freeze(d: Any) -> Any:
+    if isinstance(d, dict):
+        return frozenset((key, freeze(value)) for key, value in d.items())
+    elif isinstance(d, list):
+        return tuple(freeze(value) for value in d)
+    return d
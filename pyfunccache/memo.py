@@ -1,10 +1,18 @@
 from functools import wraps
 import datetime
+import inspect
 import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Callable, cast, Dict, Generic, Iterator, Optional, Sequence, Tuple, Type, TypeVar
+from contextlib import contextmanager, nullcontext
+from enum import Enum
+from typing import Any, Callable, cast, ContextManager, Dict, FrozenSet, Generic, Hashable, Iterable, Iterator, Optional, Sequence, Tuple, Type, TypeVar, Union
 from dataclasses import dataclass
-from .cache import Cache, ConcurrentCache, ResultLine
+from .freeze import freeze
+from .cache import Cache, ConcurrentCache, EmptyLine, RaiseLine, ResultLine, ReturnLine
+from .deps import Computation, DependencyGraph, DependentCache
+from .profiling import KeyProfiler
+from .stream import StreamLine, StreamRecorder
 
 R = TypeVar("R")
 
@@ -16,56 +24,367 @@ class CallParams:
 
     @staticmethod
     def create(real_self: Optional[object], args: Sequence[Any], kwargs: Dict[str, Any]) -> "CallParams":
-        return CallParams(CallParams.__freeze(real_self), CallParams.__freeze(args), CallParams.__freeze(kwargs))
+        return CallParams(freeze(real_self), freeze(args), freeze(kwargs))
+
+Tagger = Callable[..., Iterable[Hashable]]
+
+def tag_by_arguments(wrapped: Callable[..., Any], names: Sequence[str]) -> Tagger:
+    if type(wrapped) is staticmethod:
+        wrapped = wrapped.__func__
+    signature: inspect.Signature = inspect.signature(wrapped)
+    for name in names:
+        if name not in signature.parameters:
+            raise ValueError(f"{name!r} is not a parameter of {wrapped.__qualname__}.")
+
+    def tagger(*args: Any, **kwargs: Any) -> Iterable[Hashable]:
+        bound: inspect.BoundArguments = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return [(name, freeze(bound.arguments[name])) for name in names]
+
+    return tagger
+
+class ExceptionPolicy:
+    def __init__(
+            self,
+            ttl: Optional[datetime.timedelta] = None,
+            ttls: Optional[Dict[Type[BaseException], Optional[datetime.timedelta]]] = None,
+            never: Sequence[Type[BaseException]] = (),
+            backoff: float = 1.0,
+            max_ttl: Optional[datetime.timedelta] = None
+    ) -> None:
+        self.__ttl: Optional[datetime.timedelta] = ttl
+        self.__ttls: Dict[Type[BaseException], Optional[datetime.timedelta]] = {} if ttls is None else dict(ttls)
+        self.__never: Tuple[Type[BaseException], ...] = tuple(never)
+        self.__backoff: float = backoff
+        self.__max_ttl: Optional[datetime.timedelta] = max_ttl
 
     @staticmethod
-    def __freeze(d: Any) -> Any:
-        if isinstance(d, dict):
-            return frozenset((key, CallParams.__freeze(value)) for key, value in d.items())
-        elif isinstance(d, list):
-            return tuple(CallParams.__freeze(value) for value in d)
-        return d
+    def of(memoize_exceptions: Union[bool, "ExceptionPolicy"]) -> "ExceptionPolicy":
+        if isinstance(memoize_exceptions, ExceptionPolicy):
+            return memoize_exceptions
+        return ExceptionPolicy() if memoize_exceptions else ExceptionPolicy(never = (BaseException, ))
+
+    def cacheable(self, ouch: BaseException) -> bool:
+        return not isinstance(ouch, self.__never)
+
+    def ttl(self, ouch: BaseException, failures: int) -> Optional[datetime.timedelta]:
+        base: Optional[datetime.timedelta] = self.__ttl
+        for t in type(ouch).__mro__:
+            if t in self.__ttls:
+                base = self.__ttls[t]
+                break
+        if base is None:
+            return None
+        try:
+            ttl: datetime.timedelta = base * (self.__backoff ** (failures - 1))
+        except OverflowError:
+            return self.__max_ttl
+        return ttl if self.__max_ttl is None else min(ttl, self.__max_ttl)
+
+    def expires(self, ouch: BaseException, failures: int) -> Optional[datetime.datetime]:
+        ttl: Optional[datetime.timedelta] = self.ttl(ouch, failures)
+        if ttl is None:
+            return None
+        try:
+            return datetime.datetime.now() + ttl
+        except OverflowError:
+            return None
+
+ProfileKey = Tuple[str, CallParams]
+
+class MemoStats:
+    def __init__(self) -> None:
+        self.__lock: threading.Lock = threading.Lock()
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__computations: int = 0
+        self.__compute_time: float = 0.0
+        self.__saved_time: float = 0.0
+        self.__coalesced: int = 0
+        self.__timeouts: int = 0
+
+    def record_hit(self, line: ResultLine[Any]) -> None:
+        with self.__lock:
+            self.__hits += 1
+            self.__saved_time += line.cost
+
+    def record_miss(self) -> None:
+        with self.__lock:
+            self.__misses += 1
+
+    def record_computation(self, elapsed: float) -> None:
+        with self.__lock:
+            self.__computations += 1
+            self.__compute_time += elapsed
+
+    def record_coalesced(self) -> None:
+        with self.__lock:
+            self.__coalesced += 1
+
+    def record_timeout(self) -> None:
+        with self.__lock:
+            self.__timeouts += 1
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__hits = 0
+            self.__misses = 0
+            self.__computations = 0
+            self.__compute_time = 0.0
+            self.__saved_time = 0.0
+            self.__coalesced = 0
+            self.__timeouts = 0
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def computations(self) -> int:
+        return self.__computations
+
+    @property
+    def compute_time(self) -> float:
+        return self.__compute_time
+
+    @property
+    def saved_time(self) -> float:
+        return self.__saved_time
+
+    @property
+    def coalesced(self) -> int:
+        return self.__coalesced
+
+    @property
+    def timeouts(self) -> int:
+        return self.__timeouts
+
+class TimeoutFallback(Enum):
+    STALE = "stale"
+    RAISE = "raise"
+    COMPUTE = "compute"
+
+class InFlight(Generic[R]):
+    def __init__(self) -> None:
+        self.__done: threading.Event = threading.Event()
+        self.__line: ResultLine[R] = EmptyLine[R]()
+
+    def finish(self, line: ResultLine[R]) -> None:
+        self.__line = line
+        self.__done.set()
+
+    def wait(self, timeout: Optional[float]) -> Optional[ResultLine[R]]:
+        if not self.__done.wait(timeout):
+            return None
+        return self.__line
+
+class InFlightRegistry(Generic[R]):
+    def __init__(self) -> None:
+        self.__lock: threading.Lock = threading.Lock()
+        self.__flights: Dict[CallParams, InFlight[R]] = {}
+
+    def join(self, key: CallParams) -> Tuple[InFlight[R], bool]:
+        with self.__lock:
+            flight: Optional[InFlight[R]] = self.__flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = InFlight[R]()
+            self.__flights[key] = flight
+            return flight, True
+
+    def leave(self, key: CallParams, flight: InFlight[R]) -> None:
+        with self.__lock:
+            if self.__flights.get(key) is flight:
+                del self.__flights[key]
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__flights)
 
 class MemoizedFunction(Generic[R]):
-    def __init__(self, real_self: Optional[object], wrapped: Callable[..., R], memoize_exceptions: bool, cache: Cache[CallParams, R]) -> None:
+    def __init__(
+            self,
+            real_self: Optional[object],
+            wrapped: Callable[..., R],
+            memoize_exceptions: Union[bool, ExceptionPolicy],
+            cache: Cache[CallParams, R],
+            stats: Optional[MemoStats] = None,
+            flights: Optional[InFlightRegistry[R]] = None,
+            timeout: Optional[float] = None,
+            on_timeout: TimeoutFallback = TimeoutFallback.RAISE,
+            tags: Optional[Tagger] = None,
+            max_items: Optional[int] = None,
+            profiler: Optional[KeyProfiler[ProfileKey]] = None
+    ) -> None:
+
+        if stats is None:
+            stats = MemoStats()
+
+        if flights is None:
+            flights = InFlightRegistry[R]()
+
+        policy: ExceptionPolicy = ExceptionPolicy.of(memoize_exceptions)
 
         if type(wrapped) is staticmethod:
             wrapped = cast(staticmethod, wrapped).__func__
 
+        streaming: bool = inspect.isgeneratorfunction(wrapped)
+
+        # A profiler may be shared by several functions, so its keys say which function the arguments were for.
+        name: str = f"{getattr(wrapped, '__module__', None)}.{getattr(wrapped, '__qualname__', repr(wrapped))}"
+
         @wraps(wrapped)
         def wrapped_call(*args: Any, **kwargs: Any) -> R:
             if real_self is None:
                 return wrapped(*args, **kwargs)
             return wrapped(real_self, *args, **kwargs)
 
+        def fresh(line: ResultLine[R]) -> bool:
+            return not line.empty and not line.expired()
+
+        def tagged(args: Sequence[Any], kwargs: Dict[str, Any]) -> FrozenSet[Hashable]:
+            if tags is None:
+                return frozenset()
+            if real_self is None:
+                return frozenset(freeze(t) for t in tags(*args, **kwargs))
+            return frozenset(freeze(t) for t in tags(real_self, *args, **kwargs))
+
+        def record(f: CallParams, source: Iterator[Any], args: Sequence[Any], kwargs: Dict[str, Any]) -> R:
+            # A stream that fails or outgrows max_items must not stay cached, or every later call would replay a partial result.
+            def abort(recorder: StreamRecorder[Any]) -> None:
+                current: ResultLine[R] = cache.get_line(f)
+                if isinstance(current, ReturnLine) and current.result is recorder:
+                    cache.forget(f)
+            restart: Callable[[], Iterator[Any]] = lambda: cast(Iterator[Any], wrapped_call(*args, **kwargs))
+            return cast(R, StreamRecorder[Any](source, restart, max_items, abort, lambda: pulling(f)))
+
+        @contextmanager
+        def resumed(f: CallParams) -> Iterator[Computation]:
+            assert graph is not None
+            with graph.resuming((cache, f)) as c:
+                yield c
+            if c.stale:
+                cache.forget(f)
+
+        def pulling(f: CallParams) -> ContextManager[Optional[Computation]]:
+            if graph is None:
+                return nullcontext()
+            return resumed(f)
+
+        def deliver(line: ResultLine[R]) -> R:
+            rv: R = line.result
+            if isinstance(rv, StreamRecorder):
+                return cast(R, rv.replay())
+            return rv
+
+        graph: Optional[DependencyGraph] = cache.graph if isinstance(cache, DependentCache) else None
+
+        def computing(f: CallParams) -> ContextManager[Optional[Computation]]:
+            if graph is None:
+                return nullcontext()
+            return graph.computing((cache, f))
+
+        def compute(f: CallParams, line: ResultLine[R], args: Sequence[Any], kwargs: Dict[str, Any]) -> ResultLine[R]:
+            with computing(f) as c:
+                out: ResultLine[R] = evaluate(f, line, args, kwargs)
+            if c is not None and c.stale:
+                cache.forget(f)
+            return out
+
+        def evaluate(f: CallParams, line: ResultLine[R], args: Sequence[Any], kwargs: Dict[str, Any]) -> ResultLine[R]:
+            start: float = time.perf_counter()
+            try:
+                rv: R = wrapped_call(*args, **kwargs)
+            except BaseException as x:
+                elapsed: float = time.perf_counter() - start
+                stats.record_computation(elapsed)
+                if profiler is not None: profiler.record_computation((name, f), elapsed)
+                if not policy.cacheable(x):
+                    if not line.empty and not isinstance(line, RaiseLine): return line
+                    return RaiseLine[R](x, cost = elapsed)
+                failures: int = line.failures + 1 if isinstance(line, RaiseLine) else 1
+                raised: ResultLine[R] = RaiseLine[R](x, cost = elapsed, expires = policy.expires(x, failures), failures = failures, tags = tagged(args, kwargs))
+                cache.add_line(f, raised)
+                return raised
+            elapsed = time.perf_counter() - start
+            stats.record_computation(elapsed)
+            if profiler is not None: profiler.record_computation((name, f), elapsed)
+            returned: ResultLine[R]
+            if streaming:
+                recorder: StreamRecorder[Any] = cast(StreamRecorder[Any], record(f, cast(Iterator[Any], rv), args, kwargs))
+                returned = StreamLine[R](recorder, cost = elapsed, tags = tagged(args, kwargs))
+            else:
+                returned = ReturnLine[R](rv, cost = elapsed, tags = tagged(args, kwargs))
+            cache.add_line(f, returned)
+            return returned
+
+        def lead(f: CallParams, flight: InFlight[R], line: ResultLine[R], args: Sequence[Any], kwargs: Dict[str, Any]) -> ResultLine[R]:
+            try:
+                out: ResultLine[R] = compute(f, line, args, kwargs)
+            except BaseException as x:
+                out = RaiseLine[R](x)
+                raise x
+            finally:
+                flight.finish(out)
+                flights.leave(f, flight)
+            return out
+
+        def coalesce(f: CallParams, line: ResultLine[R], args: Sequence[Any], kwargs: Dict[str, Any]) -> ResultLine[R]:
+            if not cache.shared:
+                return compute(f, line, args, kwargs)
+            flight, owner = flights.join(f)
+            if owner:
+                current: ResultLine[R] = cache.get_line(f)
+                if not fresh(current):
+                    return lead(f, flight, current, args, kwargs)
+                flight.finish(current)
+                flights.leave(f, flight)
+                return current
+            stats.record_coalesced()
+            out: Optional[ResultLine[R]] = flight.wait(timeout)
+            if out is not None:
+                return out
+            stats.record_timeout()
+            if on_timeout is TimeoutFallback.STALE and not line.empty:
+                return line
+            if on_timeout is TimeoutFallback.COMPUTE:
+                return compute(f, line, args, kwargs)
+            raise TimeoutError(f"Gave up after {timeout} seconds waiting for an in-flight computation.")
+
         @wraps(wrapped)
         def forced(*args: Any, **kwargs: Any) -> R:
             f = CallParams.create(real_self, args, kwargs)
-            def inner(line: ResultLine[R]) -> R:
-                try:
-                    rv: R = wrapped_call(*args, **kwargs)
-                    cache.save(f, rv)
-                    return rv
-                except BaseException as x:
-                    if not memoize_exceptions and not line.empty: return line.result
-                    if memoize_exceptions: cache.save_exception(f, x)
-                    raise x
-            return cache.with_line(f, inner)
+            line: ResultLine[R] = cache.get_line(f)
+            if not cache.shared:
+                return deliver(compute(f, line, args, kwargs))
+            flight, owner = flights.join(f)
+            if owner:
+                return deliver(lead(f, flight, line, args, kwargs))
+            return deliver(compute(f, line, args, kwargs))
 
         @wraps(wrapped)
         def wrapper(*args: Any, **kwargs: Any) -> R:
             f = CallParams.create(real_self, args, kwargs)
-            def inner(line: ResultLine[R]) -> R:
-                if line.empty:
-                    return cast(R, forced(*args, **kwargs))
-                return line.result
-            return cache.with_line(f, inner)
+            line: ResultLine[R] = cache.get_line(f)
+            if profiler is not None: profiler.record_call((name, f))
+            if fresh(line):
+                stats.record_hit(line)
+                return deliver(line)
+            stats.record_miss()
+            if profiler is not None: profiler.record_miss((name, f))
+            return deliver(coalesce(f, line, args, kwargs))
 
         self.__real_self: object = real_self
         self.__forced: Callable[..., R] = forced
         self.__cache: Cache[CallParams, R] = cache
         self.__wrapped: Callable[..., R] = wrapped_call
         self.__wrapper: Callable[..., R] = wrapper
+        self.__stats: MemoStats = stats
+        self.__profiler: Optional[KeyProfiler[ProfileKey]] = profiler
 
     @property
     def wrapped(self) -> Callable[..., R]:
@@ -79,19 +398,59 @@ class MemoizedFunction(Generic[R]):
     def forced(self) -> Callable[..., R]:
          return self.__forced
 
+    @property
+    def stats(self) -> MemoStats:
+         return self.__stats
+
+    @property
+    def profiler(self) -> Optional[KeyProfiler[ProfileKey]]:
+         return self.__profiler
+
     def __call__(self, *args: Any, **kwargs: Any) -> R:
         return self.__wrapper(*args, **kwargs)
 
 class MemoizedFunctionWrapper(Generic[R]):
-    def __init__(self, wrapped: Callable[..., R], memoize_exceptions: bool, cache: Cache[CallParams, R]) -> None:
+    def __init__(
+            self,
+            wrapped: Callable[..., R],
+            memoize_exceptions: Union[bool, ExceptionPolicy],
+            cache: Cache[CallParams, R],
+            timeout: Optional[float] = None,
+            on_timeout: TimeoutFallback = TimeoutFallback.RAISE,
+            tags: Union[None, str, Sequence[str], Tagger] = None,
+            dependencies: Optional[DependencyGraph] = None,
+            max_items: Optional[int] = None,
+            profile: Union[bool, KeyProfiler[ProfileKey]] = False
+    ) -> None:
+        if dependencies is not None and not isinstance(cache, DependentCache):
+            cache = DependentCache[CallParams, R](cache, dependencies)
+        if isinstance(tags, str):
+            tags = [tags]
+        if tags is not None and not callable(tags):
+            tags = tag_by_arguments(wrapped, tags)
         self.__wrapped: Callable[..., R] = wrapped
-        self.__memoize_exceptions: bool = memoize_exceptions
+        self.__memoize_exceptions: ExceptionPolicy = ExceptionPolicy.of(memoize_exceptions)
         self.__cache: Cache[CallParams, R] = cache
+        self.__stats: MemoStats = MemoStats()
+        self.__flights: InFlightRegistry[R] = InFlightRegistry[R]()
+        self.__timeout: Optional[float] = timeout
+        self.__on_timeout: TimeoutFallback = on_timeout
+        self.__tags: Optional[Tagger] = tags
+        self.__max_items: Optional[int] = max_items
+        self.__profiler: Optional[KeyProfiler[ProfileKey]] = KeyProfiler[ProfileKey]() if profile is True else profile or None
+        self.__unbound: Optional[MemoizedFunction[R]] = None
 
     def __get__(self, obj: Optional[object], objtype: Optional[object] = None) -> MemoizedFunction[R]:
         if self.__wrapped is None:
             raise AttributeError("unreadable attribute")
-        return MemoizedFunction(obj, self.__wrapped, self.__memoize_exceptions, self.__cache)
+        if obj is not None:
+            return self.__bind(obj)
+        if self.__unbound is None:
+            self.__unbound = self.__bind(None)
+        return self.__unbound
+
+    def __bind(self, obj: Optional[object]) -> MemoizedFunction[R]:
+        return MemoizedFunction(obj, self.__wrapped, self.__memoize_exceptions, self.__cache, self.__stats, self.__flights, self.__timeout, self.__on_timeout, self.__tags, self.__max_items, self.__profiler)
 
     @property
     def wrapped(self) -> Callable[..., R]:
@@ -105,10 +464,28 @@ class MemoizedFunctionWrapper(Generic[R]):
     def forced(self) -> Callable[..., R]:
          return self.__get__(None, None).forced
 
+    @property
+    def stats(self) -> MemoStats:
+         return self.__stats
+
+    @property
+    def profiler(self) -> Optional[KeyProfiler[ProfileKey]]:
+         return self.__profiler
+
     def __call__(self, *args: Any, **kwargs: Any) -> R:
         return self.__get__(None, None)(*args, **kwargs)
 
-def memoize(wrapped: Callable[..., R], memoize_exceptions: bool, cache: Optional[Cache[CallParams, R]]) -> MemoizedFunctionWrapper[R]:
+def memoize(
+        wrapped: Callable[..., R],
+        memoize_exceptions: Union[bool, ExceptionPolicy],
+        cache: Optional[Cache[CallParams, R]],
+        timeout: Optional[float] = None,
+        on_timeout: TimeoutFallback = TimeoutFallback.RAISE,
+        tags: Union[None, str, Sequence[str], Tagger] = None,
+        dependencies: Optional[DependencyGraph] = None,
+        max_items: Optional[int] = None,
+        profile: Union[bool, KeyProfiler[ProfileKey]] = False
+) -> MemoizedFunctionWrapper[R]:
     if cache is None:
         cache = ConcurrentCache()
-    return MemoizedFunctionWrapper(wrapped, memoize_exceptions, cache)
\ No newline at end of file
+    return MemoizedFunctionWrapper(wrapped, memoize_exceptions, cache, timeout, on_timeout, tags, dependencies, max_items, profile)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import signal
+import sys
+import threading
+from typing import Any, Dict, Generic, Hashable, Iterator, List, Optional, TextIO, Tuple, TypeVar
+
+K = TypeVar("K", bound = Hashable)
+
+_PRIME: int = (1 << 61) - 1
+
+class CountMinSketch(Generic[K]):
+    def __init__(self, width: int = 2048, depth: int = 4, seed: int = 0x5EED) -> None:
+        if width < 1 or depth < 1:
+            raise ValueError("width and depth must be positive.")
+        self.__width: int = width
+        self.__depth: int = depth
+        self.__rows: List[List[float]] = [[0.0] * width for _ in range(depth)]
+        # One (a, b) pair per row turns a single hash() call into depth pairwise independent indexes.
+        self.__salts: List[Tuple[int, int]] = [((seed * 0x9E3779B97F4A7C15 + 2 * i + 1) % _PRIME, (seed + i * 0xBF58476D1CE4E5B9) % _PRIME) for i in range(depth)]
+
+    @property
+    def width(self) -> int:
+        return self.__width
+
+    @property
+    def depth(self) -> int:
+        return self.__depth
+
+    def __indexes(self, key: K) -> Iterator[Tuple[List[float], int]]:
+        h: int = hash(key)
+        width: int = self.__width
+        for row, (a, b) in zip(self.__rows, self.__salts):
+            yield row, (a * h + b) % _PRIME % width
+
+    def add(self, key: K, amount: float = 1.0) -> float:
+        estimate: Optional[float] = None
+        for row, i in self.__indexes(key):
+            row[i] += amount
+            if estimate is None or row[i] < estimate:
+                estimate = row[i]
+        return 0.0 if estimate is None else estimate
+
+    def estimate(self, key: K) -> float:
+        return min(row[i] for row, i in self.__indexes(key))
+
+    def reset(self) -> None:
+        self.__rows = [[0.0] * self.__width for _ in range(self.__depth)]
+
+class TopK(Generic[K]):
+    def __init__(self, capacity: int, width: int = 2048, depth: int = 4) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive.")
+        self.__capacity: int = capacity
+        self.__sketch: CountMinSketch[K] = CountMinSketch[K](width, depth)
+        self.__top: Dict[K, float] = {}
+        self.__heap: List[Tuple[float, int, K]] = []
+        self.__counter: Iterator[int] = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return self.__capacity
+
+    def add(self, key: K, amount: float = 1.0) -> None:
+        # Space-Saving admission, but a newcomer is scored by its sketch estimate instead of the evicted minimum.
+        estimate: float = self.__sketch.add(key, amount)
+        top: Dict[K, float] = self.__top
+        if key in top or len(top) < self.__capacity:
+            self.__set(key, estimate)
+            return
+        floor: Tuple[float, int, K] = self.__minimum()
+        if estimate <= floor[0]:
+            return
+        heapq.heappop(self.__heap)
+        del top[floor[2]]
+        self.__set(key, estimate)
+
+    def __set(self, key: K, estimate: float) -> None:
+        self.__top[key] = estimate
+        heapq.heappush(self.__heap, (estimate, next(self.__counter), key))
+        if len(self.__heap) > 4 * self.__capacity:
+            self.__heap = [(v, next(self.__counter), k) for k, v in self.__top.items()]
+            heapq.heapify(self.__heap)
+
+    def __minimum(self) -> Tuple[float, int, K]:
+        # Heap entries are replaced lazily: an entry is stale once its key was removed or re-scored.
+        heap: List[Tuple[float, int, K]] = self.__heap
+        while self.__top.get(heap[0][2]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def estimate(self, key: K) -> float:
+        return self.__sketch.estimate(key)
+
+    def top(self, n: int) -> List[Tuple[K, float]]:
+        return sorted(self.__top.items(), key = lambda kv: kv[1], reverse = True)[:n]
+
+    def reset(self) -> None:
+        self.__sketch.reset()
+        self.__top = {}
+        self.__heap = []
+
+class KeyProfiler(Generic[K]):
+    DIMENSIONS: Tuple[str, ...] = ("calls", "misses", "compute_time")
+
+    def __init__(self, capacity: int = 32, width: int = 2048, depth: int = 4) -> None:
+        # Reentrant, because a dump_on_signal handler may interrupt this same thread while it holds the lock.
+        self.__lock: threading.RLock = threading.RLock()
+        self.__tops: Dict[str, TopK[K]] = {d: TopK[K](capacity, width, depth) for d in KeyProfiler.DIMENSIONS}
+
+    def record_call(self, key: K) -> None:
+        with self.__lock:
+            self.__tops["calls"].add(key)
+
+    def record_miss(self, key: K) -> None:
+        with self.__lock:
+            self.__tops["misses"].add(key)
+
+    def record_computation(self, key: K, elapsed: float) -> None:
+        with self.__lock:
+            self.__tops["compute_time"].add(key, elapsed)
+
+    def top_keys(self, n: int, by: str = "calls") -> List[Tuple[K, float]]:
+        with self.__lock:
+            return self.__top(by).top(n)
+
+    def estimate(self, key: K, by: str = "calls") -> float:
+        with self.__lock:
+            return self.__top(by).estimate(key)
+
+    def __top(self, by: str) -> TopK[K]:
+        if by not in self.__tops:
+            raise ValueError(f"Unknown dimension {by!r}, expected one of {', '.join(KeyProfiler.DIMENSIONS)}.")
+        return self.__tops[by]
+
+    def reset(self) -> None:
+        with self.__lock:
+            for t in self.__tops.values():
+                t.reset()
+
+    def dump(self, out: Optional[TextIO] = None, n: int = 10) -> None:
+        if out is None:
+            out = sys.stderr
+        for d in KeyProfiler.DIMENSIONS:
+            out.write(f"top {n} keys by {d}:\n")
+            for key, value in self.top_keys(n, d):
+                out.write(f"  {value:>14.6g}  {key!r}\n")
+        out.flush()
+
+    def dump_on_signal(self, signum: int, out: Optional[TextIO] = None, n: int = 10) -> None:
+        def handler(received: int, frame: Any) -> None:
+            self.dump(out, n)
+        signal.signal(signum, handler)
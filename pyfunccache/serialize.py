@@ -0,0 +1,287 @@
+import datetime
+import importlib
+import pickle
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, cast, Dict, FrozenSet, Generic, Hashable, List, Optional, Set, Tuple, TypeVar, Union
+from .cache import EmptyLine, RaiseLine, ResultLine, ReturnLine
+
+try:
+    import msgpack # type: ignore
+except ImportError: # pragma: no cover
+    msgpack = None # type: ignore
+
+try:
+    import zstandard # type: ignore
+except ImportError: # pragma: no cover
+    zstandard = None # type: ignore
+
+try:
+    import lz4.frame as lz4frame # type: ignore
+except ImportError: # pragma: no cover
+    lz4frame = None # type: ignore
+
+V = TypeVar("V")
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+_EMPTY: str = "N"
+_RETURN: str = "R"
+_RAISE: str = "E"
+
+# Stands in for a cached exception whose class cannot be imported or instantiated when loading.
+class UnrestorableException(Exception):
+    def __init__(self, type_name: str, args: Tuple[Any, ...]) -> None:
+        super().__init__(f"{type_name}{args!r}")
+        self.type_name: str = type_name
+        self.original_args: Tuple[Any, ...] = args
+
+class _ExceptionState:
+    # The exception is pickled on its own, which keeps fields stored at the C level such as OSError.errno, and is also
+    # kept as plain data (class name, args and __dict__) because unpickling calls its class with args, which breaks
+    # for any __init__ whose signature differs from args.
+    def __init__(self, raised: BaseException, suppress_context: bool) -> None:
+        t: type = type(raised)
+        self.pickled: Optional[bytes] = _ExceptionState.__pickle(raised)
+        self.module: str = t.__module__
+        self.qualname: str = t.__qualname__
+        self.args: Tuple[Any, ...] = raised.args
+        self.attributes: Dict[str, Any] = dict(getattr(raised, '__dict__', {}))
+        self.cause: Optional[_ExceptionState] = None
+        self.context: Optional[_ExceptionState] = None
+        self.suppress_context: bool = suppress_context
+
+    @staticmethod
+    def __pickle(raised: BaseException) -> Optional[bytes]:
+        try:
+            return pickle.dumps(raised, protocol = 5)
+        except Exception:
+            return None
+
+    @staticmethod
+    def capture(raised: BaseException) -> "_ExceptionState":
+        return _ExceptionState.__capture(raised, {})
+
+    @staticmethod
+    def __capture(raised: BaseException, seen: Dict[int, "_ExceptionState"]) -> "_ExceptionState":
+        if id(raised) in seen:
+            return seen[id(raised)]
+        state: _ExceptionState = _ExceptionState(raised, raised.__suppress_context__)
+        seen[id(raised)] = state
+        cause: Optional[BaseException] = raised.__cause__
+        context: Optional[BaseException] = raised.__context__
+        state.cause = None if cause is None else _ExceptionState.__capture(cause, seen)
+        state.context = None if context is None else _ExceptionState.__capture(context, seen)
+        return state
+
+    def restore(self) -> BaseException:
+        return self.__restore({})
+
+    def __restore(self, seen: Dict[int, BaseException]) -> BaseException:
+        if id(self) in seen:
+            return seen[id(self)]
+        raised: BaseException = self.__rebuild()
+        seen[id(self)] = raised
+        raised.__cause__ = None if self.cause is None else self.cause.__restore(seen)
+        raised.__context__ = None if self.context is None else self.context.__restore(seen)
+        raised.__suppress_context__ = self.suppress_context
+        return raised
+
+    def __rebuild(self) -> BaseException:
+        if self.pickled is not None:
+            try:
+                return cast(BaseException, pickle.loads(self.pickled))
+            except Exception:
+                pass
+        try:
+            t: Any = importlib.import_module(self.module)
+            for part in self.qualname.split("."):
+                t = getattr(t, part)
+            if not isinstance(t, type) or not issubclass(t, BaseException):
+                raise TypeError(f"{self.module}.{self.qualname} is not an exception class.")
+            raised: BaseException = t.__new__(t)
+            raised.args = self.args
+            raised.__dict__.update(self.attributes)
+            return raised
+        except Exception:
+            proxy: UnrestorableException = UnrestorableException(f"{self.module}.{self.qualname}", self.args)
+            proxy.__dict__.update({k: v for k, v in self.attributes.items() if k not in proxy.__dict__})
+            return proxy
+
+def _iso(d: Optional[datetime.datetime]) -> Optional[str]:
+    return None if d is None else d.isoformat()
+
+def _parse_iso(d: Optional[str]) -> Optional[datetime.datetime]:
+    return None if d is None else datetime.datetime.fromisoformat(d)
+
+def _to_record(line: ResultLine[V]) -> Tuple[str, Optional[str], Any, float, int, Optional[str], int, FrozenSet[Hashable]]:
+    updated: Optional[str] = _iso(line.updated)
+    expires: Optional[str] = _iso(line.expires)
+    if line.empty:
+        return (_EMPTY, updated, None, line.cost, line.size, expires, 0, line.tags)
+    if isinstance(line, RaiseLine):
+        return (_RAISE, updated, _ExceptionState.capture(line.raised), line.cost, line.size, expires, line.failures, line.tags)
+    return (_RETURN, updated, line.result, line.cost, line.size, expires, 0, line.tags)
+
+def _from_record(kind: str, updated: Optional[str], payload: Any, cost: float, size: int, expires: Optional[str], failures: int, tags: FrozenSet[Hashable]) -> ResultLine[V]:
+    if kind == _EMPTY:
+        return EmptyLine[V]()
+    if kind == _RAISE:
+        return RaiseLine[V](cast(_ExceptionState, payload).restore(), _parse_iso(updated), cost, size, _parse_iso(expires), failures, tags)
+    if kind == _RETURN:
+        return ReturnLine[V](cast(V, payload), _parse_iso(updated), cost, size, _parse_iso(expires), tags)
+    raise ValueError(f"Unknown serialized line kind: {kind!r}")
+
+class Serializer(ABC, Generic[V]):
+    @abstractmethod
+    def dumps(self, line: ResultLine[V]) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, data: Buffer) -> ResultLine[V]:
+        pass
+
+class PickleSerializer(Serializer[V], Generic[V]):
+    __COUNT: struct.Struct = struct.Struct("<I")
+
+    def __init__(self, protocol: int = 5) -> None:
+        if protocol < 5:
+            raise ValueError("Out-of-band buffers need pickle protocol 5 or higher.")
+        self.__protocol: int = protocol
+
+    def dump_chunks(self, line: ResultLine[V]) -> List[Buffer]:
+        buffers: List[pickle.PickleBuffer] = []
+        main: bytes = pickle.dumps(_to_record(line), protocol = self.__protocol, buffer_callback = buffers.append)
+        raws: List[memoryview] = [b.raw() for b in buffers]
+        sizes: bytes = struct.pack(f"<{len(raws) + 1}Q", len(main), *(r.nbytes for r in raws))
+        return [PickleSerializer.__COUNT.pack(len(raws)), sizes, main, *raws]
+
+    def dumps(self, line: ResultLine[V]) -> bytes:
+        return b"".join(self.dump_chunks(line))
+
+    def loads(self, data: Buffer) -> ResultLine[V]:
+        view: memoryview = memoryview(data).cast("B")
+        count: int = PickleSerializer.__COUNT.unpack_from(view, 0)[0]
+        offset: int = PickleSerializer.__COUNT.size
+        sizes: Tuple[int, ...] = struct.unpack_from(f"<{count + 1}Q", view, offset)
+        offset += 8 * (count + 1)
+        main: memoryview = view[offset : offset + sizes[0]]
+        offset += sizes[0]
+        buffers: List[memoryview] = []
+        for size in sizes[1:]:
+            buffers.append(view[offset : offset + size])
+            offset += size
+        return _from_record(*pickle.loads(main, buffers = buffers))
+
+class MsgpackSerializer(Serializer[V], Generic[V]):
+    __PICKLED: int = 1
+    __RAISED: int = 2
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise ImportError("MsgpackSerializer needs the msgpack package.")
+
+    @staticmethod
+    def __default(obj: Any) -> Any:
+        if isinstance(obj, _ExceptionState):
+            return msgpack.ExtType(MsgpackSerializer.__RAISED, pickle.dumps(obj, protocol = 5))
+        return msgpack.ExtType(MsgpackSerializer.__PICKLED, pickle.dumps(obj, protocol = 5))
+
+    @staticmethod
+    def __ext_hook(code: int, data: bytes) -> Any:
+        if code in (MsgpackSerializer.__PICKLED, MsgpackSerializer.__RAISED):
+            return pickle.loads(data)
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, line: ResultLine[V]) -> bytes:
+        return cast(bytes, msgpack.packb(list(_to_record(line)), default = MsgpackSerializer.__default, strict_types = True, use_bin_type = True))
+
+    def loads(self, data: Buffer) -> ResultLine[V]:
+        return _from_record(*msgpack.unpackb(data, ext_hook = MsgpackSerializer.__ext_hook, raw = False, strict_map_key = False))
+
+class Codec(ABC):
+    @property
+    @abstractmethod
+    def tag(self) -> int:
+        pass
+
+    @abstractmethod
+    def compress(self, data: Buffer) -> bytes:
+        pass
+
+    @abstractmethod
+    def decompress(self, data: Buffer) -> bytes:
+        pass
+
+class ZlibCodec(Codec):
+    def __init__(self, level: int = 6) -> None:
+        self.__level: int = level
+
+    @property
+    def tag(self) -> int:
+        return 1
+
+    def compress(self, data: Buffer) -> bytes:
+        return zlib.compress(data, self.__level)
+
+    def decompress(self, data: Buffer) -> bytes:
+        return zlib.decompress(data)
+
+class ZstdCodec(Codec):
+    def __init__(self, level: int = 3) -> None:
+        if zstandard is None:
+            raise ImportError("ZstdCodec needs the zstandard package.")
+        self.__compressor: Any = zstandard.ZstdCompressor(level = level)
+        self.__decompressor: Any = zstandard.ZstdDecompressor()
+
+    @property
+    def tag(self) -> int:
+        return 2
+
+    def compress(self, data: Buffer) -> bytes:
+        return cast(bytes, self.__compressor.compress(data))
+
+    def decompress(self, data: Buffer) -> bytes:
+        return cast(bytes, self.__decompressor.decompress(data))
+
+class Lz4Codec(Codec):
+    def __init__(self, level: int = 0) -> None:
+        if lz4frame is None:
+            raise ImportError("Lz4Codec needs the lz4 package.")
+        self.__level: int = level
+
+    @property
+    def tag(self) -> int:
+        return 3
+
+    def compress(self, data: Buffer) -> bytes:
+        return cast(bytes, lz4frame.compress(data, compression_level = self.__level))
+
+    def decompress(self, data: Buffer) -> bytes:
+        return cast(bytes, lz4frame.decompress(data))
+
+class CompressingSerializer(Serializer[V], Generic[V]):
+    __RAW: int = 0
+
+    def __init__(self, delegate: Serializer[V], codec: Codec, threshold: int = 1024) -> None:
+        self.__delegate: Serializer[V] = delegate
+        self.__codec: Codec = codec
+        self.__threshold: int = threshold
+
+    def dumps(self, line: ResultLine[V]) -> bytes:
+        data: bytes = self.__delegate.dumps(line)
+        if len(data) >= self.__threshold:
+            packed: bytes = self.__codec.compress(data)
+            if len(packed) < len(data):
+                return bytes((self.__codec.tag, )) + packed
+        return bytes((CompressingSerializer.__RAW, )) + data
+
+    def loads(self, data: Buffer) -> ResultLine[V]:
+        view: memoryview = memoryview(data).cast("B")
+        tag: int = view[0]
+        if tag == CompressingSerializer.__RAW:
+            return self.__delegate.loads(view[1:])
+        if tag != self.__codec.tag:
+            raise ValueError(f"Data was compressed with codec {tag}, but this serializer uses codec {self.__codec.tag}.")
+        return self.__delegate.loads(self.__codec.decompress(view[1:]))
@@ -0,0 +1,152 @@
+from contextlib import nullcontext
+import itertools
+import sys
+import threading
+import time
+from typing import Any, Callable, cast, ContextManager, Generic, Hashable, Iterable, Iterator, List, Optional, TypeVar, Union
+from .cache import deep_size, ReturnLine
+
+T = TypeVar("T")
+
+class _Truncated:
+    pass
+
+_TRUNCATED: _Truncated = _Truncated()
+
+class _Handover(Generic[T]):
+    def __init__(self, item: T, source: Iterator[T]) -> None:
+        self.item: T = item
+        self.source: Iterator[T] = source
+
+class StreamRecorder(Generic[T]):
+    def __init__(
+            self,
+            source: Iterator[T],
+            restart: Callable[[], Iterator[T]],
+            max_items: Optional[int] = None,
+            on_abort: Optional[Callable[["StreamRecorder[T]"], None]] = None,
+            pulling: Optional[Callable[[], ContextManager[Any]]] = None
+    ) -> None:
+        if max_items is not None and max_items < 0:
+            raise ValueError("max_items must not be negative.")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__source: Optional[Iterator[T]] = source
+        self.__restart: Callable[[], Iterator[T]] = restart
+        self.__max_items: Optional[int] = max_items
+        self.__on_abort: Optional[Callable[[StreamRecorder[T]], None]] = on_abort
+        self.__buffer: List[T] = []
+        self.__done: bool = False
+        self.__truncated: bool = False
+        self.__error: Optional[BaseException] = None
+        self.__pulling: Callable[[], ContextManager[Any]] = nullcontext if pulling is None else pulling
+        self.__elapsed: float = 0.0
+        self.__items_size: int = 0
+
+    @property
+    def elapsed(self) -> float:
+        return self.__elapsed
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.__buffer) + self.__items_size
+
+    @property
+    def recorded(self) -> int:
+        return len(self.__buffer)
+
+    @property
+    def done(self) -> bool:
+        return self.__done
+
+    @property
+    def truncated(self) -> bool:
+        return self.__truncated
+
+    def replay(self) -> "StreamReplay[T]":
+        return StreamReplay[T](self)
+
+    def restart(self) -> Iterator[T]:
+        return self.__restart()
+
+    def fetch(self, index: int) -> Union[T, _Truncated, _Handover[T]]:
+        # Items already recorded are read without locking: the buffer only ever grows by append.
+        buffer: List[T] = self.__buffer
+        if index < len(buffer):
+            return buffer[index]
+        with self.__lock:
+            if index < len(buffer):
+                return buffer[index]
+            if self.__error is not None:
+                raise self.__error
+            if self.__done:
+                raise StopIteration
+            if self.__source is None:
+                return _TRUNCATED
+            source: Iterator[T] = self.__source
+            try:
+                item: T = self.__pull(source)
+            except StopIteration:
+                self.__done = True
+                self.__source = None
+                raise
+            except BaseException as x:
+                self.__error = x
+                self.__source = None
+                self.__abort()
+                raise
+            if self.__max_items is not None and len(buffer) >= self.__max_items:
+                self.__truncated = True
+                self.__source = None
+                self.__abort()
+                return _Handover[T](item, source)
+            buffer.append(item)
+            self.__items_size += deep_size(item)
+            return item
+
+    def __pull(self, source: Iterator[T]) -> T:
+        start: float = time.perf_counter()
+        try:
+            with self.__pulling():
+                return next(source)
+        finally:
+            self.__elapsed += time.perf_counter() - start
+
+    def __abort(self) -> None:
+        if self.__on_abort is not None:
+            self.__on_abort(self)
+
+class StreamReplay(Iterator[T], Generic[T]):
+    def __init__(self, recorder: StreamRecorder[T]) -> None:
+        self.__recorder: StreamRecorder[T] = recorder
+        self.__index: int = 0
+        self.__private: Optional[Iterator[T]] = None
+
+    def __iter__(self) -> "StreamReplay[T]":
+        return self
+
+    def __next__(self) -> T:
+        if self.__private is not None:
+            return next(self.__private)
+        got: Union[T, _Truncated, _Handover[T]] = self.__recorder.fetch(self.__index)
+        if isinstance(got, _Truncated):
+            self.__private = itertools.islice(self.__recorder.restart(), self.__index, None)
+            return next(self.__private)
+        if isinstance(got, _Handover):
+            self.__private = got.source
+            return got.item
+        self.__index += 1
+        return got
+
+class StreamLine(ReturnLine[T], Generic[T]):
+    # The generator body runs lazily, long after the line was saved, so its cost and size keep growing as items are pulled.
+    def __init__(self, recorder: StreamRecorder[Any], cost: float = 0.0, tags: Iterable[Hashable] = ()) -> None:
+        super().__init__(cast(T, recorder), cost = cost, tags = tags)
+        self.__recorder: StreamRecorder[Any] = recorder
+
+    @property
+    def cost(self) -> float:
+        return super().cost + self.__recorder.elapsed
+
+    @property
+    def size(self) -> int:
+        return self.__recorder.size
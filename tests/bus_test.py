@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import socket
+import time
+from pytest import raises, mark # type: ignore
+from typing import *
+from pyfunccache.bus import BroadcastCache, DeliveryError, InvalidationBus, LocalHub, LocalTransport, UnixSocketTransport
+from pyfunccache.cache import *
+from pyfunccache.memo import *
+
+def eventually(what: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline: float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if what(): return True
+        time.sleep(0.005)
+    return what()
+
+class CountingTransport(LocalTransport):
+    def __init__(self, hub: LocalHub) -> None:
+        super().__init__(hub)
+        self.sent: int = 0
+
+    def send(self, payload: bytes) -> None:
+        self.sent += 1
+        super().send(payload)
+
+class StuckTransport(LocalTransport):
+    def __init__(self, hub: LocalHub) -> None:
+        super().__init__(hub)
+        self.stuck: bool = True
+        self.retries: int = 0
+
+    def send(self, payload: bytes) -> None:
+        super().send(payload)
+        if self.stuck:
+            raise DeliveryError({'stuck': BlockingIOError()})
+
+    def send_to(self, peer: str, payload: bytes) -> None:
+        assert peer == 'stuck'
+        self.retries += 1
+        if self.stuck:
+            raise DeliveryError({'stuck': BlockingIOError()})
+        super().send_to(peer, payload)
+
+def local_pair() -> Tuple[InvalidationBus, InvalidationBus]:
+    hub: LocalHub = LocalHub()
+    a: InvalidationBus = InvalidationBus(hub.transport())
+    b: InvalidationBus = InvalidationBus(hub.transport())
+    return a, b
+
+def test_forget_fans_out() -> None:
+    a, b = local_pair()
+    with a, b:
+        ca: BroadcastCache[int, str] = a.attach("f", ConcurrentCache[int, str]())
+        cb: BroadcastCache[int, str] = b.attach("f", ConcurrentCache[int, str]())
+        b.attach("other", SimpleCache[int, str]()).save(1, 'z')
+        ca.save(1, 'a')
+        cb.save(1, 'b')
+        cb.save(2, 'b')
+        ca.forget(1)
+        assert eventually(lambda: not cb.has_cached(1))
+        assert cb.get_cached(2) == 'b'
+        assert not ca.has_cached(1)
+        assert b.errors == []
+
+def test_reset_and_tags_fan_out() -> None:
+    a, b = local_pair()
+    with a, b:
+        ca: BroadcastCache[int, str] = a.attach("f", ConcurrentCache[int, str]())
+        cb: BroadcastCache[int, str] = b.attach("f", ConcurrentCache[int, str]())
+        cb.add_line(1, ReturnLine[str]('x', tags = ['t']))
+        cb.add_line(2, ReturnLine[str]('y'))
+        ca.invalidate_tag('t')
+        assert eventually(lambda: not cb.has_cached(1))
+        assert cb.has_cached(2)
+        ca.reset()
+        assert eventually(lambda: not cb.has_cached(2))
+
+def test_overwrite_fans_out_but_first_write_does_not() -> None:
+    a, b = local_pair()
+    with a, b:
+        ca: BroadcastCache[int, str] = a.attach("f", ConcurrentCache[int, str]())
+        cb: BroadcastCache[int, str] = b.attach("f", ConcurrentCache[int, str]())
+        cb.save(1, 'b')
+        ca.save(1, 'a')
+        a.flush()
+        time.sleep(0.05)
+        assert cb.get_cached(1) == 'b'
+        ca.save(1, 'c')
+        assert eventually(lambda: not cb.has_cached(1))
+        assert ca.get_cached(1) == 'c'
+
+def test_own_messages_are_ignored() -> None:
+    hub: LocalHub = LocalHub()
+    with InvalidationBus(hub.transport()) as a:
+        ca: BroadcastCache[int, str] = a.attach("f", ConcurrentCache[int, str]())
+        ca.forget(1)
+        a.flush()
+        ca.save(1, 'a')
+        time.sleep(0.05)
+        assert ca.get_cached(1) == 'a'
+        with raises(ValueError):
+            a.attach("f", SimpleCache[int, str]())
+
+def test_batching() -> None:
+    hub: LocalHub = LocalHub()
+    t: CountingTransport = CountingTransport(hub)
+    with InvalidationBus(t, flush_interval = 0.2, max_batch = 1000) as a, InvalidationBus(hub.transport()) as b:
+        ca: BroadcastCache[int, int] = a.attach("f", ConcurrentCache[int, int]())
+        cb: BroadcastCache[int, int] = b.attach("f", ConcurrentCache[int, int]())
+        for i in range(100):
+            cb.save(i, i)
+        for i in range(100):
+            ca.forget(i)
+        assert eventually(lambda: not any(cb.has_cached(i) for i in range(100)))
+        assert t.sent == 1
+
+def test_lost_batch_is_followed_by_reset_of_that_peer() -> None:
+    hub: LocalHub = LocalHub()
+    t: StuckTransport = StuckTransport(hub)
+    with InvalidationBus(t) as a, InvalidationBus(hub.transport()) as b:
+        ca: BroadcastCache[int, str] = a.attach("f", ConcurrentCache[int, str]())
+        cb: BroadcastCache[int, str] = b.attach("f", ConcurrentCache[int, str]())
+        cb.save(1, 'b')
+        cb.save(2, 'b')
+        ca.forget(1)
+        assert eventually(lambda: not cb.has_cached(1))
+        # Here b stands for every healthy peer: while the stuck peer keeps failing, nobody else is reset over and over.
+        time.sleep(1.0)
+        assert cb.has_cached(2)
+        assert 1 <= t.retries <= 5
+        assert len(a.errors) <= 6
+        assert all(isinstance(x, DeliveryError) for x in a.errors)
+        t.stuck = False
+        assert eventually(lambda: not cb.has_cached(2))
+        retries: int = t.retries
+        time.sleep(0.3)
+        assert t.retries == retries
+
+def test_memoized_function_over_bus() -> None:
+    a, b = local_pair()
+    with a, b:
+        calls: List[int] = []
+
+        def square(q: int) -> int:
+            calls.append(q)
+            return q * q
+
+        fa: MemoizedFunctionWrapper[int] = memoize(square, True, a.attach("square", ConcurrentCache[CallParams, int]()))
+        fb: MemoizedFunctionWrapper[int] = memoize(square, True, b.attach("square", ConcurrentCache[CallParams, int]()))
+        assert fa(3) == 9
+        assert fb(3) == 9
+        assert fb(3) == 9
+        assert calls == [3, 3]
+        fa.cache.forget(CallParams.create(None, (3, ), {}))
+        assert eventually(lambda: not fb.cache.has_cached(CallParams.create(None, (3, ), {})))
+        assert fb(3) == 9
+        assert calls == [3, 3, 3]
+
+class Service:
+    pass
+
+def test_method_keys_widen_to_reset() -> None:
+    a, b = local_pair()
+    with a, b:
+        sa: Service = Service()
+        sb: Service = Service()
+        ca: BroadcastCache[CallParams, int] = a.attach("square", ConcurrentCache[CallParams, int]())
+        cb: BroadcastCache[CallParams, int] = b.attach("square", ConcurrentCache[CallParams, int]())
+        ca.save(CallParams.create(sa, (3, ), {}), 9)
+        cb.save(CallParams.create(sb, (3, ), {}), 9)
+        # The receiving side unpickles its own copy of sa, which compares by identity and so can never match a key there.
+        ca.forget(CallParams.create(sa, (3, ), {}))
+        assert eventually(lambda: not cb.has_cached(CallParams.create(sb, (3, ), {})))
+        assert b.errors == []
+
+unix: Any = mark.skipif(not hasattr(socket, "AF_UNIX"), reason = "needs unix domain sockets")
+
+@unix # type: ignore
+def test_unix_socket_transport(tmp_path: Any) -> None:
+    with InvalidationBus(UnixSocketTransport(str(tmp_path))) as a, InvalidationBus(UnixSocketTransport(str(tmp_path))) as b:
+        ca: BroadcastCache[str, str] = a.attach("f", ConcurrentCache[str, str]())
+        cb: BroadcastCache[str, str] = b.attach("f", ConcurrentCache[str, str]())
+        cb.save('k', 'v')
+        cb.save('other', 'v')
+        ca.forget('k')
+        assert eventually(lambda: not cb.has_cached('k'))
+        assert cb.has_cached('other')
+        huge: str = 'x' * 100000
+        ca.forget(huge)
+        assert eventually(lambda: not cb.has_cached('other'))
+        assert a.errors == []
+
+@unix # type: ignore
+def test_unix_socket_removes_dead_subscribers(tmp_path: Any) -> None:
+    dead: UnixSocketTransport = UnixSocketTransport(str(tmp_path))
+    dead_path: str = dead.path
+    dead.close()
+    with open(dead_path, "w"):
+        pass
+    alive: UnixSocketTransport = UnixSocketTransport(str(tmp_path))
+    try:
+        alive.send(b'ping')
+        assert alive.receive(1.0) == b'ping'
+        assert not os.path.exists(dead_path)
+    finally:
+        alive.close()
+
+@unix # type: ignore
+def test_unix_socket_reports_full_subscribers(tmp_path: Any) -> None:
+    slow: UnixSocketTransport = UnixSocketTransport(str(tmp_path))
+    fast: UnixSocketTransport = UnixSocketTransport(str(tmp_path))
+    try:
+        with raises(DeliveryError) as info:
+            for _ in range(100000):
+                fast.send(b'x' * 1000)
+                while fast.receive(0.001) is not None:
+                    pass
+        assert slow.path in info.value.failures
+        assert fast.path not in info.value.failures
+        with raises(DeliveryError):
+            fast.send_to(slow.path, b'reset')
+        while slow.receive(0.001) is not None:
+            pass
+        fast.send_to(slow.path, b'reset')
+        assert slow.receive(1.0) == b'reset'
+    finally:
+        slow.close()
+        fast.close()
+
+@unix # type: ignore
+def test_unix_socket_refuses_shared_directory(tmp_path: Any) -> None:
+    os.chmod(str(tmp_path), 0o755)
+    with raises(PermissionError):
+        UnixSocketTransport(str(tmp_path))
+    assert os.listdir(str(tmp_path)) == []
+
+def child(directory: str, ready: Any, done: Any) -> None:
+    with InvalidationBus(UnixSocketTransport(directory)) as bus:
+        c: BroadcastCache[str, str] = bus.attach("f", ConcurrentCache[str, str]())
+        c.save('k', 'v')
+        ready.set()
+        done.put(eventually(lambda: not c.has_cached('k'), 10.0))
+
+@unix # type: ignore
+@mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason = "needs fork") # type: ignore
+def test_unix_socket_across_processes(tmp_path: Any) -> None:
+    ctx: Any = multiprocessing.get_context("fork")
+    ready: Any = ctx.Event()
+    done: Any = ctx.Queue()
+    p: Any = ctx.Process(target = child, args = (str(tmp_path), ready, done))
+    p.start()
+    try:
+        assert ready.wait(10.0)
+        with InvalidationBus(UnixSocketTransport(str(tmp_path))) as bus:
+            bus.attach("f", ConcurrentCache[str, str]()).forget('k')
+            assert done.get(timeout = 10.0) is True
+    finally:
+        p.join(10.0)
+    assert p.exitcode == 0
@@ -1,4 +1,7 @@
+import gc
+import sys
 import threading
+import weakref
 import queue
 from pytest import raises, mark # type: ignore
 from typing import *
@@ -132,15 +135,68 @@ def forget_cache_test(x: Cache[K, SI]) -> None:
     assert xe.value is e
     with raises(KeyError) as xxx: x.get_cached(p5())
 
+def invalidate_tag_cache_test(x: Cache[K, SI]) -> None:
+    e: ValueError = ValueError(':(')
+
+    x.add_line(p1(), ReturnLine[SI]('a', tags = ['tenant-1', 'users']))
+    x.add_line(p2(), ReturnLine[SI]('b', tags = ['tenant-2', 'users']))
+    x.add_line(p3(), ReturnLine[SI](123, tags = ['tenant-1']))
+    x.add_line(p4(), RaiseLine[SI](e, tags = ['tenant-1']))
+    x.save(p5(), 'e')
+
+    x.invalidate_tag('tenant-1')
+
+    assert not x.has_cached(p1())
+    assert x.get_cached(p2()) == 'b'
+    assert not x.has_cached(p3())
+    assert not x.has_cached(p4())
+    assert x.get_cached(p5()) == 'e'
+
+    x.invalidate_tag('tenant-1')
+    x.invalidate_tag('nobody')
+    assert x.has_cached(p2())
+
+    x.add_line(p1(), ReturnLine[SI]('a', tags = ['users']))
+    x.forget(p2())
+    x.save(p2(), 'b')
+    x.invalidate_tag('users')
+
+    assert not x.has_cached(p1())
+    assert x.get_cached(p2()) == 'b'
+    assert x.get_cached(p5()) == 'e'
+
+    x.add_line(p1(), ReturnLine[SI]('a', tags = ['old']))
+    x.add_line(p1(), ReturnLine[SI]('b', tags = ['new']))
+    x.add_line(p2(), ReturnLine[SI]('c', tags = ['old']))
+    x.add_line(p2(), ReturnLine[SI]('d'))
+    x.invalidate_tag('old')
+
+    assert x.get_cached(p1()) == 'b'
+    assert x.get_cached(p2()) == 'd'
+
+    x.invalidate_tag('new')
+
+    assert not x.has_cached(p1())
+    assert x.get_cached(p2()) == 'd'
+
 def expiring() -> ExpiringCache[K, SI]:
     return ExpiringCache[K, SI](datetime.timedelta(seconds = 10), SimpleCache[K, SI]())
 
+def greedy() -> GreedyDualSizeCache[K, SI]:
+    return GreedyDualSizeCache[K, SI](1000000, ConcurrentCache[K, SI]())
+
+def near() -> NearCache[K, SI]:
+    return NearCache[K, SI](4)
+
 caches: List[P] = [
     SimpleCache[K, SI],
     ThreadLocalCache[K, SI],
     SyncCache[K, SI],
     ConcurrentCache[K, SI],
-    expiring
+    expiring,
+    greedy,
+    SnapshotCache[K, SI],
+    near
 ]
 
 @mark.parametrize("cache", caches) # type: ignore
@@ -163,6 +219,10 @@ def test_reset(cache: P) -> None:
 def test_forget(cache: P) -> None:
     forget_cache_test(cache())
 
+@mark.parametrize("cache", caches) # type: ignore
+def test_invalidate_tag(cache: P) -> None:
+    invalidate_tag_cache_test(cache())
+
 @mark.timeout(1) # type: ignore
 def test_ThreadLocalCache_isolation() -> None:
     x: ThreadLocalCache[K, SI] = ThreadLocalCache[K, SI]()
@@ -247,4 +307,237 @@ def test_expiration() -> None:
     assert x.has_cached(123)
     assert x.get_cached(123) == 'a'
     time.sleep(2)
-    assert not x.has_cached(123)
\ No newline at end of file
+    assert not x.has_cached(123)
+
+def test_greedy_dual_size_eviction() -> None:
+    x: GreedyDualSizeCache[int, str] = GreedyDualSizeCache[int, str](300, SimpleCache[int, str]())
+    x.add_line(1, ReturnLine[str]('cheap', cost = 0.001, size = 100))
+    x.add_line(2, ReturnLine[str]('expensive', cost = 2.0, size = 100))
+    x.add_line(3, ReturnLine[str]('medium', cost = 0.5, size = 100))
+    assert x.used == 300
+    x.add_line(4, ReturnLine[str]('new', cost = 0.1, size = 100))
+    assert x.used == 300
+    assert not x.has_cached(1)
+    assert x.has_cached(2)
+    assert x.has_cached(3)
+    assert x.has_cached(4)
+    x.add_line(5, ReturnLine[str]('new', cost = 0.1, size = 100))
+    assert not x.has_cached(4)
+    assert x.has_cached(2)
+
+def test_greedy_dual_size_prefers_small() -> None:
+    x: GreedyDualSizeCache[int, str] = GreedyDualSizeCache[int, str](1000, SimpleCache[int, str]())
+    x.add_line(1, ReturnLine[str]('big', cost = 1.0, size = 900))
+    x.add_line(2, ReturnLine[str]('small', cost = 1.0, size = 100))
+    x.add_line(3, ReturnLine[str]('small', cost = 1.0, size = 100))
+    assert not x.has_cached(1)
+    assert x.has_cached(2)
+    assert x.has_cached(3)
+    assert x.used == 200
+
+def test_greedy_dual_size_forget() -> None:
+    x: GreedyDualSizeCache[int, str] = GreedyDualSizeCache[int, str](1000, SimpleCache[int, str]())
+    x.add_line(1, ReturnLine[str]('a', cost = 1.0, size = 400))
+    x.add_line(2, ReturnLine[str]('b', cost = 1.0, size = 400))
+    x.forget(1)
+    assert x.used == 400
+    x.add_line(3, ReturnLine[str]('c', cost = 1.0, size = 400))
+    assert x.has_cached(2)
+    assert x.has_cached(3)
+    x.reset()
+    assert x.used == 0
+    assert not x.has_cached(2)
+
+def test_greedy_dual_size_hits_keep_heap_bounded() -> None:
+    x: GreedyDualSizeCache[int, str] = GreedyDualSizeCache[int, str](300, SimpleCache[int, str]())
+    x.add_line(1, ReturnLine[str]('a', cost = 1.0, size = 100))
+    x.add_line(2, ReturnLine[str]('b', cost = 2.0, size = 100))
+    x.add_line(3, ReturnLine[str]('c', cost = 3.0, size = 100))
+    x.add_line(4, ReturnLine[str]('d', cost = 4.0, size = 100))
+    for _ in range(10000):
+        x.get_line(2)
+        x.get_line(3)
+    assert x.heap_size <= 2 * 3 + 16
+
+def test_deep_size() -> None:
+    nested: List[List[int]] = [[i * 1000 + j for j in range(1000)] for i in range(100)]
+    assert deep_size(nested) > 100 * 1000 * sys.getsizeof(100000)
+    assert ReturnLine[Any](nested).size == deep_size(nested)
+    assert ReturnLine[Any](nested, size = 7).size == 7
+    assert deep_size({'k': 'x' * 1000}) > 1000
+    assert deep_size(ValueError('x' * 1000)) > 1000
+
+def test_greedy_dual_size_measures_nested_results() -> None:
+    x: GreedyDualSizeCache[int, Any] = GreedyDualSizeCache[int, Any](100000, SimpleCache[int, Any]())
+    x.add_line(1, ReturnLine[Any]([1, 2, 3], cost = 1.0))
+    x.add_line(2, ReturnLine[Any]([[i * 100 + j for j in range(100)] for i in range(100)], cost = 1.0))
+    x.add_line(3, ReturnLine[Any]((4, 5, 6), cost = 1.0))
+    x.add_line(4, ReturnLine[Any]({'a': 'b'}, cost = 1.0))
+    assert not x.has_cached(2)
+    assert x.has_cached(1)
+    assert x.has_cached(3)
+    assert x.has_cached(4)
+
+def test_snapshot_batch() -> None:
+    x: SnapshotCache[int, str] = SnapshotCache[int, str]()
+    x.save(1, 'a')
+    with x.batch():
+        x.save(2, 'b')
+        x.forget(1)
+        with x.batch():
+            x.save(3, 'c')
+        assert not x.has_cached(1)
+        assert x.get_cached(2) == 'b'
+        assert x.get_cached(3) == 'c'
+    assert not x.has_cached(1)
+    assert x.get_cached(2) == 'b'
+    assert x.get_cached(3) == 'c'
+
+@mark.timeout(5) # type: ignore
+def test_snapshot_concurrent_writes() -> None:
+    x: SnapshotCache[int, int] = SnapshotCache[int, int]()
+
+    def writer(base: int) -> None:
+        for j in range(200):
+            x.save(base + j, j)
+
+    threads = [threading.Thread(target = writer, args = (t * 1000, )) for t in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    for t in range(8):
+        for j in range(200):
+            assert x.get_cached(t * 1000 + j) == j
+
+def test_snapshot_many_writes() -> None:
+    x: SnapshotCache[int, int] = SnapshotCache[int, int]()
+    for i in range(5000):
+        x.save(i, i)
+        if i % 3 == 0: x.forget(i)
+    for i in range(5000):
+        assert x.has_cached(i) == (i % 3 != 0)
+        if i % 3 != 0: assert x.get_cached(i) == i
+
+def test_snapshot_batch_visible_to_other_threads() -> None:
+    x: SnapshotCache[int, str] = SnapshotCache[int, str]()
+    with x.batch():
+        in_thread(lambda: x.save(1, 'a'))
+        assert x.get_cached(1) == 'a'
+
+def test_greedy_dual_size_invalidate_tag() -> None:
+    x: GreedyDualSizeCache[int, str] = GreedyDualSizeCache[int, str](1000, SimpleCache[int, str]())
+    x.add_line(1, ReturnLine[str]('a', cost = 1.0, size = 400, tags = ['t']))
+    x.add_line(2, ReturnLine[str]('b', cost = 1.0, size = 400))
+    x.invalidate_tag('t')
+    assert x.used == 400
+    assert not x.has_cached(1)
+    assert x.has_cached(2)
+
+def test_snapshot_invalidate_tag_in_batch() -> None:
+    x: SnapshotCache[int, str] = SnapshotCache[int, str]()
+    x.add_line(1, ReturnLine[str]('a', tags = ['t']))
+    with x.batch():
+        x.add_line(2, ReturnLine[str]('b', tags = ['t']))
+        assert x.has_cached(2)
+        x.invalidate_tag('t')
+        assert not x.has_cached(1)
+    assert not x.has_cached(1)
+    assert not x.has_cached(2)
+
+def test_tag_index() -> None:
+    x: TagIndex[int] = TagIndex[int]()
+    x.add(1, {'a', 'b'})
+    x.add(2, {'b'})
+    x.add(3, set())
+    assert len(x) == 2
+    assert sorted(x.pop('b')) == [1, 2]
+    assert len(x) == 0
+    assert x.pop('a') == []
+def in_thread(what: Callable[[], Any]) -> Any:
+    r: queue.Queue[Any] = queue.Queue()
+    t = threading.Thread(target = lambda: r.put(what()))
+    t.start()
+    t.join()
+    return r.get()
+
+def test_ThreadLocalCache_reset_all_threads() -> None:
+    x: ThreadLocalCache[int, str] = ThreadLocalCache[int, str]()
+    x.save(1, 'a')
+    in_thread(x.reset)
+    assert not x.has_cached(1)
+
+def test_near_cache_bounded() -> None:
+    x: NearCache[int, str] = NearCache[int, str](2)
+    for i in range(5):
+        x.save(i, str(i))
+        assert x.get_cached(i) == str(i)
+    assert x.local_size() == 2
+    assert x.get_cached(0) == '0'
+    assert x.local_size() == 2
+    with raises(ValueError):
+        NearCache[int, str](0)
+
+def test_near_cache_forget_in_other_thread() -> None:
+    x: NearCache[int, str] = NearCache[int, str](8)
+    x.save(1, 'a')
+    x.save(2, 'b')
+    assert x.get_cached(1) == 'a'
+    assert x.local_size() == 1
+    in_thread(lambda: x.forget(1))
+    assert not x.has_cached(1)
+    assert x.get_cached(2) == 'b'
+    in_thread(lambda: x.save(2, 'c'))
+    assert x.get_cached(2) == 'c'
+    in_thread(x.reset)
+    assert not x.has_cached(2)
+
+def test_near_cache_reclaims_exited_threads() -> None:
+    class Value:
+        pass
+
+    x: NearCache[int, Value] = NearCache[int, Value](8)
+    v: Value = Value()
+    ref: weakref.ref[Value] = weakref.ref(v)
+    x.save(1, v)
+    del v
+    assert in_thread(lambda: x.get_cached(1)) is ref()
+    x.delegate.forget(1)
+    gc.collect()
+    assert ref() is None
+
+@mark.timeout(10) # type: ignore
+def test_ConcurrentCache_invalidate_tag_never_misses_visible_entries() -> None:
+    x: ConcurrentCache[int, str] = ConcurrentCache[int, str]()
+    stop: threading.Event = threading.Event()
+    missed: List[int] = []
+
+    def writer() -> None:
+        i: int = 0
+        while not stop.is_set():
+            x.add_line(i, ReturnLine[str]('v', tags = ['t']))
+            i += 1
+
+    def invalidator() -> None:
+        for i in range(20000):
+            if x.has_cached(i):
+                x.invalidate_tag('t')
+                if x.has_cached(i): missed.append(i)
+
+    w = threading.Thread(target = writer)
+    w.start()
+    invalidator()
+    stop.set()
+    w.join()
+    assert missed == []
+
+def test_near_cache_respects_delegate_expiry() -> None:
+    x: NearCache[int, str] = NearCache[int, str](8, ExpiringCache[int, str](datetime.timedelta(seconds = 0.1), ConcurrentCache[int, str]()))
+    x.save(1, 'a')
+    assert x.get_cached(1) == 'a'
+    assert x.local_size() == 1
+    time.sleep(0.2)
+    assert not x.has_cached(1)
+    assert x.local_size() == 0
+    x.add_line(2, ReturnLine[str]('b', expires = datetime.datetime.now() + datetime.timedelta(seconds = 0.1)))
+    assert x.get_cached(2) == 'b'
+    time.sleep(0.2)
+    assert not x.has_cached(2)
@@ -0,0 +1,22 @@
+import datetime
+from pytest import fixture # type: ignore
+from typing import *
+from pyfunccache.cache import *
+from pyfunccache.memo import CallParams
+
+CacheFactory = Callable[[], Cache[CallParams, Any]]
+
+cache_factories: Dict[str, CacheFactory] = {
+    "SimpleCache": SimpleCache[CallParams, Any],
+    "ThreadLocalCache": ThreadLocalCache[CallParams, Any],
+    "SyncCache": SyncCache[CallParams, Any],
+    "ConcurrentCache": ConcurrentCache[CallParams, Any],
+    "SnapshotCache": SnapshotCache[CallParams, Any],
+    "NearCache": lambda: NearCache[CallParams, Any](16),
+    "GreedyDualSizeCache": lambda: GreedyDualSizeCache[CallParams, Any](1000000, ConcurrentCache[CallParams, Any]()),
+    "ExpiringCache": lambda: ExpiringCache[CallParams, Any](datetime.timedelta(seconds = 10), ConcurrentCache[CallParams, Any]()),
+}
+
+@fixture(params = list(cache_factories.values()), ids = list(cache_factories.keys())) # type: ignore
+def cache(request: Any) -> CacheFactory:
+    return cast(CacheFactory, request.param)
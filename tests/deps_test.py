@@ -0,0 +1,177 @@
+import datetime
+import threading
+import time
+from pytest import raises, mark # type: ignore
+from typing import *
+from pyfunccache.cache import *
+from pyfunccache.deps import *
+from pyfunccache.memo import *
+
+class Spreadsheet:
+    def __init__(self, cache: Callable[[], Cache[CallParams, Any]]) -> None:
+        graph: DependencyGraph = DependencyGraph()
+        self.cells: Dict[str, int] = {'a': 1, 'b': 2, 'c': 3}
+        self.calls: List[str] = []
+
+        def cell(name: str) -> int:
+            self.calls.append(name)
+            return self.cells[name]
+
+        def total() -> int:
+            self.calls.append('total')
+            return self.cell('a') + self.cell('b')
+
+        def report() -> str:
+            self.calls.append('report')
+            return f"{self.total()}/{self.cell('c')}"
+
+        self.cell: MemoizedFunctionWrapper[int] = memoize(cell, True, cache(), dependencies = graph)
+        self.total: MemoizedFunctionWrapper[int] = memoize(total, True, cache(), dependencies = graph)
+        self.report: MemoizedFunctionWrapper[str] = memoize(report, True, cache(), dependencies = graph)
+        self.graph: DependencyGraph = graph
+
+    def key(self, *args: Any) -> CallParams:
+        return CallParams.create(None, args, {})
+
+def test_forget_cascades(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Spreadsheet = Spreadsheet(cache)
+    assert s.report() == '3/3'
+    assert s.calls == ['report', 'total', 'a', 'b', 'c']
+    s.calls.clear()
+    assert s.report() == '3/3'
+    assert s.calls == []
+
+    s.cells['a'] = 10
+    s.cell.cache.forget(s.key('a'))
+    assert not s.total.cache.has_cached(s.key())
+    assert not s.report.cache.has_cached(s.key())
+    assert s.report() == '12/3'
+    assert s.calls == ['report', 'total', 'a']
+
+    s.calls.clear()
+    s.cells['c'] = 30
+    s.cell.cache.forget(s.key('c'))
+    assert s.total.cache.has_cached(s.key())
+    assert s.report() == '12/30'
+    assert s.calls == ['report', 'c']
+
+def test_recompute_cascades_only_on_change(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Spreadsheet = Spreadsheet(cache)
+    assert s.report() == '3/3'
+    s.calls.clear()
+
+    assert s.cell.forced('b') == 2
+    assert s.report.cache.has_cached(s.key())
+    assert s.calls == ['b']
+
+    s.cells['b'] = 5
+    assert s.cell.forced('b') == 5
+    assert not s.total.cache.has_cached(s.key())
+    assert not s.report.cache.has_cached(s.key())
+    assert s.report() == '6/3'
+
+def test_reset_and_tags_cascade(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Spreadsheet = Spreadsheet(cache)
+    assert s.report() == '3/3'
+    s.total.cache.reset()
+    assert not s.report.cache.has_cached(s.key())
+    assert s.cell.cache.has_cached(s.key('a'))
+
+    assert s.report() == '3/3'
+    s.cell.cache.add_line(s.key('b'), ReturnLine[Any](7, tags = ['b']))
+    assert not s.report.cache.has_cached(s.key())
+    assert s.report() == '8/3'
+    s.cell.cache.invalidate_tag('b')
+    assert not s.report.cache.has_cached(s.key())
+    assert s.report() == '3/3'
+
+    s.cell.cache.add_line(s.key('b'), ReturnLine[Any](7, tags = ['b']))
+    s.cell.cache.add_line(s.key('b'), ReturnLine[Any](9, tags = ['c']))
+    assert s.report() == '10/3'
+    s.cell.cache.invalidate_tag('b')
+    assert s.report.cache.has_cached(s.key())
+    assert s.report() == '10/3'
+
+def test_expired_dependency_cascades() -> None:
+    graph: DependencyGraph = DependencyGraph()
+    data: Dict[str, int] = {'a': 1}
+
+    def inner(name: str) -> int:
+        return data[name]
+
+    def outer() -> int:
+        return inner_f('a') * 10
+
+    inner_f: MemoizedFunctionWrapper[int] = memoize(inner, True, ExpiringCache[CallParams, Any](datetime.timedelta(seconds = 0.1), ConcurrentCache[CallParams, Any]()), dependencies = graph)
+    outer_f: MemoizedFunctionWrapper[int] = memoize(outer, True, ConcurrentCache[CallParams, Any](), dependencies = graph)
+    assert outer_f() == 10
+    data['a'] = 2
+    time.sleep(0.2)
+    assert inner_f('a') == 2
+    assert outer_f() == 20
+
+def test_evicted_dependency_cascades() -> None:
+    graph: DependencyGraph = DependencyGraph()
+    data: Dict[int, int] = {1: 1, 2: 5}
+
+    def inner(k: int) -> int:
+        return data[k]
+
+    def outer() -> int:
+        return inner_f(1) * 10
+
+    inner_cache: GreedyDualSizeCache[CallParams, Any] = GreedyDualSizeCache[CallParams, Any](1, ConcurrentCache[CallParams, Any]())
+    inner_f: MemoizedFunctionWrapper[int] = memoize(inner, True, inner_cache, dependencies = graph)
+    outer_f: MemoizedFunctionWrapper[int] = memoize(outer, True, ConcurrentCache[CallParams, Any](), dependencies = graph)
+    assert outer_f() == 10
+    inner_f(2)
+    data[1] = 3
+    assert inner_f(1) == 3
+    assert outer_f() == 30
+
+def test_dependency_edges() -> None:
+    s: Spreadsheet = Spreadsheet(SimpleCache[CallParams, Any])
+    s.report()
+    report: Node = (s.report.cache, s.key())
+    total: Node = (s.total.cache, s.key())
+    a: Node = (s.cell.cache, s.key('a'))
+    assert s.graph.dependencies(report) == {total, (s.cell.cache, s.key('c'))}
+    assert s.graph.dependents(a) == {total}
+    s.total.forced()
+    assert s.graph.dependencies(total) == {a, (s.cell.cache, s.key('b'))}
+    s.cell.cache.forget(s.key('a'))
+    assert s.graph.dependents(a) == set()
+    assert s.graph.dependencies(total) == set()
+    assert s.graph.dependencies(report) == set()
+    assert s.graph.dependents((s.cell.cache, s.key('c'))) == set()
+    assert s.graph.nodes_of(s.report.cache) == []
+    assert s.graph.nodes_of(s.total.cache) == []
+    assert s.graph.nodes_of(s.cell.cache) == []
+
+@mark.timeout(5) # type: ignore
+def test_invalidated_while_computing() -> None:
+    graph: DependencyGraph = DependencyGraph()
+    reading: threading.Event = threading.Event()
+    resume: threading.Event = threading.Event()
+    value: List[int] = [1]
+
+    @lambda f: memoize(f, True, ConcurrentCache[CallParams, int](), dependencies = graph)
+    def inner() -> int:
+        return value[0]
+
+    @lambda f: memoize(f, True, ConcurrentCache[CallParams, int](), dependencies = graph)
+    def outer() -> int:
+        v: int = inner()
+        reading.set()
+        resume.wait()
+        return v
+
+    t = threading.Thread(target = outer)
+    t.start()
+    reading.wait()
+    value[0] = 2
+    inner.cache.forget(CallParams.create(None, (), {}))
+    resume.set()
+    t.join()
+    assert not outer.cache.has_cached(CallParams.create(None, (), {}))
+    assert outer() == 2
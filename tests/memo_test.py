@@ -8,29 +8,25 @@ import time
 
 T = TypeVar("T")
 
-def k(x: int) -> Callable[[Callable[..., T]], MemoizedFunctionWrapper[T]]:
+def k(x: int, memoize_exceptions: Union[bool, ExceptionPolicy] = True, **options: Any) -> Callable[[Callable[..., T]], MemoizedFunctionWrapper[T]]:
+    factories: List[Callable[[], Cache[CallParams, T]]] = [
+        SimpleCache[CallParams, T],
+        SimpleCache[CallParams, T],
+        ThreadLocalCache[CallParams, T],
+        SyncCache[CallParams, T],
+        ConcurrentCache[CallParams, T],
+        lambda: ExpiringCache[CallParams, T](datetime.timedelta(seconds = 10), SimpleCache[CallParams, T]()),
+        lambda: GreedyDualSizeCache[CallParams, T](1000000, ConcurrentCache[CallParams, T]()),
+        SnapshotCache[CallParams, T],
+        lambda: NearCache[CallParams, T](16),
+    ]
 
     def a(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, SimpleCache[CallParams, T]())
+        return memoize(f, memoize_exceptions, factories[x](), **options)
 
-    def b(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, SimpleCache[CallParams, T]())
+    return a
 
-    def c(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, ThreadLocalCache[CallParams, T]())
-
-    def d(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, SyncCache[CallParams, T]())
-
-    def e(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, ConcurrentCache[CallParams, T]())
-
-    def f(f: Callable[..., T]) -> MemoizedFunctionWrapper[T]:
-        return memoize(f, True, ExpiringCache[CallParams, T](datetime.timedelta(seconds = 10), SimpleCache[CallParams, T]()))
-
-    return [a, b, c, d, e, f][x]
-
-pcaches: Sequence[int] = range(0, 6)
+pcaches: Sequence[int] = range(0, 9)
 
 memi: int
 
@@ -286,3 +282,303 @@ def test_memoize_instance_multiparam(i: int) -> None:
     assert x.k == 0
     assert y.j == 0
     assert y.k == 3
+
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_stats(i: int) -> None:
+
+    mem = k(i)
+
+    @mem
+    def bar(q: int) -> int:
+        time.sleep(0.01)
+        return q * 2
+
+    assert bar(1) == 2
+    assert bar(1) == 2
+    assert bar(1) == 2
+    assert bar(2) == 4
+    assert bar.forced(2) == 4
+    assert bar.stats.hits == 2
+    assert bar.stats.misses == 2
+    assert bar.stats.computations == 3
+    assert bar.stats.compute_time >= 0.03
+    assert bar.stats.saved_time >= 0.02
+    assert bar.stats.saved_time < bar.stats.compute_time
+    bar.stats.reset()
+    assert bar.stats.hits == 0
+    assert bar.stats.saved_time == 0.0
+
+memf: int
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_exception_policy(i: int) -> None:
+
+    policy = k(i, ExceptionPolicy(
+        ttl = datetime.timedelta(seconds = 0.2),
+        ttls = {KeyError: None},
+        never = (TimeoutError, ),
+        backoff = 2.0,
+        max_ttl = datetime.timedelta(seconds = 0.3)
+    ))
+
+    global memf
+    memf = 0
+
+    @policy
+    def bar(x: Type[BaseException]) -> int:
+        global memf
+        memf = memf + 1
+        raise x()
+
+    with raises(TimeoutError) as xxx: bar(TimeoutError)
+    with raises(TimeoutError) as xxx: bar(TimeoutError)
+    assert memf == 2
+    assert not bar.cache.has_cached(CallParams.create(None, (TimeoutError, ), {}))
+
+    with raises(KeyError) as xxx: bar(KeyError)
+    with raises(KeyError) as xxx: bar(KeyError)
+    assert memf == 3
+    assert bar.cache.get_line(CallParams.create(None, (KeyError, ), {})).expires is None
+
+    with raises(ValueError) as xxx: bar(ValueError)
+    with raises(ValueError) as xxx: bar(ValueError)
+    assert memf == 4
+    time.sleep(0.25)
+    with raises(ValueError) as xxx: bar(ValueError)
+    assert memf == 5
+    line: ResultLine[int] = bar.cache.get_line(CallParams.create(None, (ValueError, ), {}))
+    assert cast(RaiseLine[int], line).failures == 2
+    time.sleep(0.25)
+    with raises(ValueError) as xxx: bar(ValueError)
+    assert memf == 5
+    time.sleep(0.1)
+    with raises(ValueError) as xxx: bar(ValueError)
+    assert memf == 6
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_no_exceptions_keeps_value(i: int) -> None:
+
+    never = k(i, False)
+
+    fail: List[bool] = [False]
+
+    @never
+    def bar() -> int:
+        if fail[0]: raise ValueError()
+        return 42
+
+    assert bar() == 42
+    fail[0] = True
+    assert bar.forced() == 42
+    bar.cache.forget(CallParams.create(None, (), {}))
+    with raises(ValueError) as xxx: bar()
+    with raises(ValueError) as xxx: bar()
+    assert not bar.cache.has_cached(CallParams.create(None, (), {}))
+
+def test_exception_policy_ttl() -> None:
+    p: ExceptionPolicy = ExceptionPolicy(ttl = datetime.timedelta(seconds = 1), ttls = {OSError: datetime.timedelta(seconds = 5)}, backoff = 3.0, max_ttl = datetime.timedelta(seconds = 30))
+    assert p.ttl(ValueError(), 1) == datetime.timedelta(seconds = 1)
+    assert p.ttl(ValueError(), 3) == datetime.timedelta(seconds = 9)
+    assert p.ttl(ConnectionError(), 1) == datetime.timedelta(seconds = 5)
+    assert p.ttl(ConnectionError(), 2) == datetime.timedelta(seconds = 15)
+    assert p.ttl(ConnectionError(), 3) == datetime.timedelta(seconds = 30)
+    assert p.ttl(ValueError(), 100000) == datetime.timedelta(seconds = 30)
+    assert ExceptionPolicy(ttl = datetime.timedelta(seconds = 1), backoff = 2.0).expires(ValueError(), 100000) is None
+    assert ExceptionPolicy.of(True).cacheable(KeyboardInterrupt())
+    assert not ExceptionPolicy.of(False).cacheable(ValueError())
+
+shared_pcaches: Sequence[int] = [i for i in pcaches if i != 2]
+
+@mark.timeout(5) # type: ignore
+@mark.parametrize("i", shared_pcaches) # type: ignore
+def test_memoize_coalescing(i: int) -> None:
+
+    mem = k(i)
+    started: threading.Event = threading.Event()
+    release: threading.Event = threading.Event()
+    calls: List[int] = []
+
+    @mem
+    def bar(q: int) -> int:
+        calls.append(q)
+        started.set()
+        release.wait()
+        return q * 10
+
+    results: queue.Queue[int] = queue.Queue()
+    owner = threading.Thread(target = lambda: results.put(bar(3)))
+    owner.start()
+    started.wait()
+    waiters = [threading.Thread(target = lambda: results.put(bar(3))) for _ in range(5)]
+    for w in waiters: w.start()
+    while bar.stats.coalesced < 5: time.sleep(0.01)
+    release.set()
+    owner.join()
+    for w in waiters: w.join()
+    assert [results.get() for _ in range(6)] == [30] * 6
+    assert calls == [3]
+    assert bar.stats.coalesced == 5
+    assert bar.stats.misses == 6
+    assert bar.stats.computations == 1
+
+@mark.timeout(5) # type: ignore
+@mark.parametrize("i", shared_pcaches) # type: ignore
+def test_memoize_coalescing_exception(i: int) -> None:
+
+    mem = k(i, False)
+    started: threading.Event = threading.Event()
+    release: threading.Event = threading.Event()
+
+    @mem
+    def bar() -> int:
+        started.set()
+        release.wait()
+        raise ValueError('ouch')
+
+    errors: queue.Queue[BaseException] = queue.Queue()
+
+    def call() -> None:
+        try:
+            bar()
+        except BaseException as x:
+            errors.put(x)
+
+    owner = threading.Thread(target = call)
+    owner.start()
+    started.wait()
+    waiter = threading.Thread(target = call)
+    waiter.start()
+    while bar.stats.coalesced < 1: time.sleep(0.01)
+    release.set()
+    owner.join()
+    waiter.join()
+    a: BaseException = errors.get()
+    b: BaseException = errors.get()
+    assert type(a) == ValueError
+    assert a is b
+    assert bar.stats.computations == 1
+
+@mark.timeout(5) # type: ignore
+@mark.parametrize("i", shared_pcaches) # type: ignore
+@mark.parametrize("fallback", list(TimeoutFallback)) # type: ignore
+def test_memoize_coalescing_timeout(i: int, fallback: TimeoutFallback) -> None:
+
+    mem = k(i, timeout = 0.05, on_timeout = fallback)
+    started: threading.Event = threading.Event()
+    release: threading.Event = threading.Event()
+    calls: List[int] = []
+
+    @mem
+    def bar() -> int:
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            release.wait()
+            return 1
+        return 2
+
+    past: datetime.datetime = datetime.datetime.now() - datetime.timedelta(seconds = 1)
+    bar.cache.add_line(CallParams.create(None, (), {}), ReturnLine[int](7, expires = past))
+
+    owner = threading.Thread(target = bar)
+    owner.start()
+    started.wait()
+    if fallback is TimeoutFallback.RAISE:
+        with raises(TimeoutError) as xxx: bar()
+    elif fallback is TimeoutFallback.STALE:
+        assert bar() == 7
+    else:
+        assert bar() == 2
+    release.set()
+    owner.join()
+    assert bar.stats.timeouts == 1
+    assert len(calls) == (2 if fallback is TimeoutFallback.COMPUTE else 1)
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_expired_value(i: int) -> None:
+
+    mem = k(i)
+    calls: List[int] = []
+
+    @mem
+    def bar() -> int:
+        calls.append(1)
+        return len(calls)
+
+    past: datetime.datetime = datetime.datetime.now() - datetime.timedelta(seconds = 1)
+    bar.cache.add_line(CallParams.create(None, (), {}), ReturnLine[int](7, expires = past))
+    assert bar() == 1
+    assert bar() == 1
+
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_tags_by_argument(i: int) -> None:
+
+    calls: List[Tuple[str, int]] = []
+
+    @k(i, tags = 'tenant')
+    def bar(tenant: str, item: int, extra: List[int] = []) -> int:
+        calls.append((tenant, item))
+        return item
+
+    assert bar('a', 1) == 1
+    assert bar('a', 2) == 2
+    assert bar('b', 1) == 1
+    assert bar(tenant = 'a', item = 3) == 3
+    assert len(calls) == 4
+    bar.cache.invalidate_tag(('tenant', 'a'))
+    assert bar('b', 1) == 1
+    assert len(calls) == 4
+    assert bar('a', 1) == 1
+    assert bar('a', 2) == 2
+    assert bar(tenant = 'a', item = 3) == 3
+    assert len(calls) == 7
+
+@mark.parametrize("i", pcaches) # type: ignore
+def test_memoize_tags_by_function(i: int) -> None:
+
+    class Whoa:
+        def __init__(self, name: str) -> None:
+            self.name: str = name
+            self.j: int = 0
+
+        @k(i, tags = lambda self, q: [self.name, ('q', q)])
+        def bar(self, q: int) -> int:
+            self.j = self.j + 1
+            return self.j
+
+    x = Whoa('x')
+    y = Whoa('y')
+    assert x.bar(1) == 1
+    assert x.bar(2) == 2
+    assert y.bar(1) == 1
+    Whoa.bar.cache.invalidate_tag('x')
+    assert y.bar(1) == 1
+    assert x.bar(1) == 3
+    Whoa.bar.cache.invalidate_tag(('q', 1))
+    assert x.bar(1) == 4
+    assert x.bar(2) == 5
+    assert x.bar(2) == 5
+    assert y.bar(1) == 2
+
+def test_tag_by_arguments_rejects_unknown_names() -> None:
+    def bar(a: int) -> int:
+        return a
+
+    with raises(ValueError) as xxx: tag_by_arguments(bar, ['b'])
+    assert list(tag_by_arguments(bar, ['a'])(5)) == [('a', 5)]
+    assert list(tag_by_arguments(bar, ['a'])([1, 2])) == [('a', (1, 2))]
+
+def test_near_cache_over_expiring_recomputes() -> None:
+    data: List[int] = [1]
+
+    def m() -> int:
+        return data[0]
+
+    f: MemoizedFunctionWrapper[int] = memoize(m, True, NearCache[CallParams, int](16, ExpiringCache[CallParams, int](datetime.timedelta(seconds = 0.1), ConcurrentCache[CallParams, int]())))
+    assert f() == 1
+    data[0] = 2
+    assert f() == 1
+    time.sleep(0.2)
+    assert f() == 2
@@ -0,0 +1,98 @@
+import io
+import os
+import random
+import signal
+from pytest import raises, mark # type: ignore
+from typing import *
+from pyfunccache.cache import *
+from pyfunccache.memo import *
+from pyfunccache.profiling import CountMinSketch, KeyProfiler, TopK
+
+def test_count_min_never_underestimates() -> None:
+    x: CountMinSketch[int] = CountMinSketch[int](64, 4)
+    counts: Dict[int, int] = {}
+    rnd: random.Random = random.Random(7)
+    for _ in range(5000):
+        k: int = rnd.randrange(500)
+        counts[k] = counts.get(k, 0) + 1
+        x.add(k)
+    for k, c in counts.items():
+        assert x.estimate(k) >= c
+    x.reset()
+    assert x.estimate(1) == 0
+    with raises(ValueError):
+        CountMinSketch[int](0, 4)
+
+def test_top_k_finds_heavy_hitters() -> None:
+    x: TopK[int] = TopK[int](5)
+    rnd: random.Random = random.Random(11)
+    keys: List[int] = rnd.choices(range(10000), weights = [1.0 / (k + 1) ** 1.2 for k in range(10000)], k = 50000)
+    for k in keys:
+        x.add(k)
+    assert [k for k, _ in x.top(3)] == [0, 1, 2]
+    assert len(x.top(100)) == 5
+
+def test_top_k_weighted() -> None:
+    x: TopK[str] = TopK[str](2)
+    for _ in range(100):
+        x.add('cheap', 0.001)
+    x.add('slow', 3.0)
+    x.add('slower', 5.0)
+    assert [k for k, _ in x.top(2)] == ['slower', 'slow']
+
+def test_memoize_profile() -> None:
+    def square(q: int) -> int:
+        return q * q
+
+    f: MemoizedFunctionWrapper[int] = memoize(square, True, ConcurrentCache[CallParams, int](), profile = True)
+    for _ in range(10):
+        f(3)
+    for _ in range(4):
+        f(4)
+    f.cache.forget(CallParams.create(None, (4, ), {}))
+    f(4)
+    f(5)
+    p: Optional[KeyProfiler[ProfileKey]] = f.profiler
+    assert p is not None
+    name: str = f"{__name__}.test_memoize_profile.<locals>.square"
+    assert p.top_keys(2) == [((name, CallParams.create(None, (3, ), {})), 10.0), ((name, CallParams.create(None, (4, ), {})), 5.0)]
+    assert p.top_keys(1, "misses")[0] == ((name, CallParams.create(None, (4, ), {})), 2.0)
+    assert len(p.top_keys(10, "compute_time")) == 3
+    with raises(ValueError):
+        p.top_keys(1, "nonsense")
+
+def test_memoize_without_profile() -> None:
+    f: MemoizedFunctionWrapper[int] = memoize(lambda q: q, True, None)
+    f(1)
+    assert f.profiler is None
+
+def test_memoize_shared_profiler() -> None:
+    def f(q: int) -> int:
+        return q
+
+    def h(q: int) -> int:
+        return -q
+
+    p: KeyProfiler[ProfileKey] = KeyProfiler[ProfileKey](4)
+    mf: MemoizedFunctionWrapper[int] = memoize(f, True, None, profile = p)
+    mh: MemoizedFunctionWrapper[int] = memoize(h, True, None, profile = p)
+    mf(1)
+    mh(1)
+    mh(1)
+    assert mf.profiler is p
+    prefix: str = f"{__name__}.test_memoize_shared_profiler.<locals>."
+    assert p.top_keys(2) == [((prefix + 'h', CallParams.create(None, (1, ), {})), 2.0), ((prefix + 'f', CallParams.create(None, (1, ), {})), 1.0)]
+
+@mark.skipif(not hasattr(signal, "SIGUSR1"), reason = "needs SIGUSR1") # type: ignore
+def test_dump_on_signal() -> None:
+    p: KeyProfiler[str] = KeyProfiler[str]()
+    p.record_call('hot')
+    out: io.StringIO = io.StringIO()
+    old: Any = signal.getsignal(signal.SIGUSR1)
+    try:
+        p.dump_on_signal(signal.SIGUSR1, out)
+        os.kill(os.getpid(), signal.SIGUSR1)
+    finally:
+        signal.signal(signal.SIGUSR1, old)
+    assert "top 10 keys by calls:" in out.getvalue()
+    assert "'hot'" in out.getvalue()
@@ -0,0 +1,189 @@
+import datetime
+import pickle
+from pytest import importorskip, raises, mark # type: ignore
+from typing import *
+from pyfunccache.cache import *
+from pyfunccache.serialize import *
+
+P = Callable[[], Serializer[Any]]
+
+class Ouch(Exception):
+    def __init__(self, code: int) -> None:
+        super().__init__(code)
+        self.code: int = code
+
+class Pair(Exception):
+    def __init__(self, a: int, b: int) -> None:
+        super().__init__(f"{a}:{b}")
+        self.a: int = a
+        self.b: int = b
+
+class KeywordOnly(Exception):
+    def __init__(self, *, reason: str) -> None:
+        super().__init__(reason)
+        self.reason: str = reason
+
+class Picky(Exception):
+    def __new__(cls, code: int) -> "Picky":
+        return super().__new__(cls, code)
+
+class Stubborn(Exception):
+    def __new__(cls, *, code: int) -> "Stubborn":
+        return super().__new__(cls, code)
+
+    def __init__(self, *, code: int) -> None:
+        super().__init__(code)
+
+def pickled() -> Serializer[Any]:
+    return PickleSerializer[Any]()
+
+def packed() -> Serializer[Any]:
+    importorskip("msgpack")
+    return MsgpackSerializer[Any]()
+
+def zipped() -> Serializer[Any]:
+    return CompressingSerializer[Any](PickleSerializer[Any](), ZlibCodec(), 64)
+
+def zstd() -> Serializer[Any]:
+    importorskip("zstandard")
+    return CompressingSerializer[Any](PickleSerializer[Any](), ZstdCodec(), 64)
+
+def lz4() -> Serializer[Any]:
+    importorskip("lz4")
+    return CompressingSerializer[Any](PickleSerializer[Any](), Lz4Codec(), 64)
+
+serializers: List[P] = [pickled, packed, zipped, zstd, lz4]
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_return_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    for value in ['a', 123, None, (1, 'x'), [1, 2, 3], {'k': (4, 5)}, b'\x00' * 5000, frozenset({1, 2})]:
+        line: ReturnLine[Any] = ReturnLine[Any](value)
+        back: ResultLine[Any] = s.loads(s.dumps(line))
+        assert back == line
+        assert type(back.result) == type(value)
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_empty_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    assert s.loads(s.dumps(EmptyLine[Any]())) == EmptyLine[Any]()
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_exception_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    try:
+        try:
+            raise KeyError('inner')
+        except KeyError as k:
+            raise Ouch(42) from k
+    except Ouch as o:
+        o.add_note('some note')
+        line: RaiseLine[Any] = RaiseLine[Any](o)
+
+    back: ResultLine[Any] = s.loads(s.dumps(line))
+    assert not back.empty
+    assert back.updated == line.updated
+    with raises(Ouch) as xe: back.result
+    assert xe.value is not line.raised
+    assert xe.value.code == 42
+    assert xe.value.args == (42, )
+    assert xe.value.__notes__ == ['some note']
+    assert type(xe.value.__cause__) == KeyError
+    assert xe.value.__cause__.args == ('inner', )
+    assert xe.value.__context__ is xe.value.__cause__
+    assert xe.value.__suppress_context__
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_exception_constructor_shapes(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    back: ResultLine[Any] = s.loads(s.dumps(RaiseLine[Any](Pair(1, 2))))
+    with raises(Pair) as xp: back.result
+    assert xp.value.args == ('1:2', )
+    assert (xp.value.a, xp.value.b) == (1, 2)
+    back = s.loads(s.dumps(RaiseLine[Any](KeywordOnly(reason = 'nope'))))
+    with raises(KeywordOnly) as xk: back.result
+    assert xk.value.args == ('nope', )
+    assert xk.value.reason == 'nope'
+    back = s.loads(s.dumps(RaiseLine[Any](Picky(7))))
+    with raises(Picky) as xpk: back.result
+    assert xpk.value.args == (7, )
+    back = s.loads(s.dumps(RaiseLine[Any](FileNotFoundError(2, 'nope', '/x'))))
+    with raises(FileNotFoundError) as xf: back.result
+    assert (xf.value.errno, xf.value.strerror, xf.value.filename) == (2, 'nope', '/x')
+    back = s.loads(s.dumps(RaiseLine[Any](TimeoutError(110, 'late'))))
+    with raises(TimeoutError) as xt: back.result
+    assert xt.value.errno == 110
+    back = s.loads(s.dumps(RaiseLine[Any](StopIteration(5))))
+    with raises(StopIteration) as xs: back.result
+    assert xs.value.value == 5
+    back = s.loads(s.dumps(RaiseLine[Any](SystemExit(3))))
+    with raises(SystemExit) as xe: back.result
+    assert xe.value.code == 3
+    back = s.loads(s.dumps(RaiseLine[Any](UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte'))))
+    with raises(UnicodeDecodeError) as xd: back.result
+    assert xd.value.reason == 'invalid start byte'
+    assert str(xd.value) != ''
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_unrestorable_exception(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    back: ResultLine[Any] = s.loads(s.dumps(RaiseLine[Any](Stubborn(code = 7))))
+    with raises(UnrestorableException) as xu: back.result
+    assert xu.value.type_name.endswith('Stubborn')
+    assert xu.value.original_args == (7, )
+
+def test_out_of_band_buffers() -> None:
+    s: PickleSerializer[Any] = PickleSerializer[Any]()
+    big: bytearray = bytearray(b'x' * 100000)
+    line: ReturnLine[Any] = ReturnLine[Any](pickle.PickleBuffer(big))
+    chunks: List[Any] = s.dump_chunks(line)
+    assert len(chunks) == 4
+    assert memoryview(chunks[3]).nbytes == 100000
+    back: ResultLine[Any] = s.loads(s.dumps(line))
+    assert bytes(back.result) == bytes(big)
+
+def test_compression_threshold() -> None:
+    plain: PickleSerializer[Any] = PickleSerializer[Any]()
+    s: CompressingSerializer[Any] = CompressingSerializer[Any](plain, ZlibCodec(), 1024)
+    small: ReturnLine[Any] = ReturnLine[Any]('a')
+    large: ReturnLine[Any] = ReturnLine[Any]('a' * 10000)
+    assert s.dumps(small)[0] == 0
+    assert s.dumps(large)[0] == ZlibCodec().tag
+    assert len(s.dumps(large)) < len(plain.dumps(large))
+    assert s.loads(s.dumps(small)) == small
+    assert s.loads(s.dumps(large)) == large
+
+def test_wrong_codec() -> None:
+    a: CompressingSerializer[Any] = CompressingSerializer[Any](PickleSerializer[Any](), ZlibCodec(), 0)
+
+    class OtherCodec(ZlibCodec):
+        @property
+        def tag(self) -> int:
+            return 99
+
+    b: CompressingSerializer[Any] = CompressingSerializer[Any](PickleSerializer[Any](), OtherCodec(), 0)
+    with raises(ValueError) as xxx: b.loads(a.dumps(ReturnLine[Any]('a' * 1000)))
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_cost_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    line: ReturnLine[Any] = ReturnLine[Any]('a', cost = 1.5, size = 77)
+    back: ResultLine[Any] = s.loads(s.dumps(line))
+    assert back.cost == 1.5
+    assert back.size == 77
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_negative_entry_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    expires: datetime.datetime = datetime.datetime.now() + datetime.timedelta(seconds = 5)
+    line: RaiseLine[Any] = RaiseLine[Any](TimeoutError('slow'), expires = expires, failures = 3)
+    back: ResultLine[Any] = s.loads(s.dumps(line))
+    assert back.expires == expires
+    assert cast(RaiseLine[Any], back).failures == 3
+
+@mark.parametrize("serializer", serializers) # type: ignore
+def test_tags_round_trip(serializer: P) -> None:
+    s: Serializer[Any] = serializer()
+    line: ReturnLine[Any] = ReturnLine[Any]('a', tags = ['t', ('tenant', 1)])
+    back: ResultLine[Any] = s.loads(s.dumps(line))
+    assert back.tags == frozenset({'t', ('tenant', 1)})
@@ -0,0 +1,177 @@
+import threading
+import time
+from pytest import raises, mark # type: ignore
+from typing import *
+from pyfunccache.cache import *
+from pyfunccache.memo import *
+from pyfunccache.deps import DependencyGraph
+from pyfunccache.stream import StreamLine, StreamRecorder
+
+class Source:
+    def __init__(self) -> None:
+        self.starts: int = 0
+        self.pulled: List[int] = []
+
+    def items(self, n: int) -> Iterator[int]:
+        self.starts += 1
+        for i in range(n):
+            self.pulled.append(i)
+            yield i
+
+def test_recorder_is_lazy() -> None:
+    s: Source = Source()
+    r: StreamRecorder[int] = StreamRecorder[int](s.items(5), lambda: s.items(5))
+    first: Iterator[int] = r.replay()
+    assert next(first) == 0
+    assert s.pulled == [0]
+    second: Iterator[int] = r.replay()
+    assert next(second) == 0
+    assert next(second) == 1
+    assert s.pulled == [0, 1]
+    assert list(first) == [1, 2, 3, 4]
+    assert list(second) == [2, 3, 4]
+    assert list(r.replay()) == [0, 1, 2, 3, 4]
+    assert r.done
+    assert s.starts == 1
+
+def test_recorder_max_items() -> None:
+    s: Source = Source()
+    aborted: List[StreamRecorder[int]] = []
+    r: StreamRecorder[int] = StreamRecorder[int](s.items(6), lambda: s.items(6), 3, aborted.append)
+    lagging: Iterator[int] = r.replay()
+    assert next(lagging) == 0
+    assert list(r.replay()) == [0, 1, 2, 3, 4, 5]
+    assert r.truncated
+    assert r.recorded == 3
+    assert aborted == [r]
+    assert s.starts == 1
+    assert list(lagging) == [1, 2, 3, 4, 5]
+    assert s.starts == 2
+
+def test_recorder_negative_max_items() -> None:
+    with raises(ValueError):
+        StreamRecorder[int](iter([]), lambda: iter([]), -1)
+
+def test_memoize_generator(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Source = Source()
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(s.items, True, cache())
+    first: Iterator[int] = f(4)
+    assert s.pulled == []
+    assert next(first) == 0
+    assert list(f(4)) == [0, 1, 2, 3]
+    assert list(first) == [1, 2, 3]
+    assert list(f(4)) == [0, 1, 2, 3]
+    assert s.starts == 1
+    assert f.stats.hits == 2
+    assert list(f(2)) == [0, 1]
+    assert s.starts == 2
+
+def test_memoize_generator_forced(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Source = Source()
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(s.items, True, cache())
+    assert list(f(3)) == [0, 1, 2]
+    assert list(f.forced(3)) == [0, 1, 2]
+    assert list(f(3)) == [0, 1, 2]
+    assert s.starts == 2
+
+def test_memoize_generator_max_items(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    s: Source = Source()
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(s.items, True, cache(), max_items = 2)
+    assert list(f(2)) == [0, 1]
+    assert list(f(2)) == [0, 1]
+    assert s.starts == 1
+    assert list(f(5)) == [0, 1, 2, 3, 4]
+    assert not f.cache.has_cached(CallParams.create(None, (5, ), {}))
+    assert list(f(5)) == [0, 1, 2, 3, 4]
+    assert s.starts == 3
+
+def test_memoize_generator_failure(cache: Callable[[], Cache[CallParams, Any]]) -> None:
+    calls: List[int] = []
+
+    def broken() -> Iterator[int]:
+        calls.append(1)
+        yield 1
+        if len(calls) == 1:
+            raise KeyError("first")
+        yield 2
+
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(broken, True, cache())
+    first: Iterator[int] = f()
+    assert next(first) == 1
+    with raises(KeyError):
+        next(first)
+    assert not f.cache.has_cached(CallParams.create(None, (), {}))
+    assert list(f()) == [1, 2]
+    assert list(f()) == [1, 2]
+    assert len(calls) == 2
+
+def test_memoize_generator_concurrent() -> None:
+    gate: threading.Event = threading.Event()
+    starts: List[int] = []
+
+    def slow() -> Iterator[int]:
+        starts.append(1)
+        for i in range(50):
+            if i == 10:
+                gate.wait(5)
+            yield i
+
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(slow, True, ConcurrentCache[CallParams, Any]())
+    results: List[List[int]] = []
+    lock: threading.Lock = threading.Lock()
+
+    def consume() -> None:
+        got: List[int] = list(f())
+        with lock:
+            results.append(got)
+
+    threads: List[threading.Thread] = [threading.Thread(target = consume) for _ in range(8)]
+    for t in threads: t.start()
+    gate.set()
+    for t in threads: t.join()
+    assert len(starts) == 1
+    assert results == [list(range(50))] * 8
+
+def test_stream_cost_counts_pulled_items() -> None:
+    def slow() -> Iterator[int]:
+        for i in range(3):
+            time.sleep(0.02)
+            yield i
+
+    f: MemoizedFunctionWrapper[Iterator[int]] = memoize(slow, True, ConcurrentCache[CallParams, Any]())
+    assert list(f()) == [0, 1, 2]
+    line: ResultLine[Any] = f.cache.get_line(CallParams.create(None, (), {}))
+    assert isinstance(line, StreamLine)
+    assert line.cost >= 0.05
+
+def test_stream_size_counts_recorded_items() -> None:
+    def rows() -> Iterator[str]:
+        for i in range(100):
+            yield str(i) * 1000
+
+    f: MemoizedFunctionWrapper[Iterator[str]] = memoize(rows, True, ConcurrentCache[CallParams, Any]())
+    it: Iterator[str] = f()
+    line: ResultLine[Any] = f.cache.get_line(CallParams.create(None, (), {}))
+    before: int = line.size
+    assert list(it)[-1] == '99' * 1000
+    assert line.size > before + 100 * 1000
+
+def test_stream_records_dependencies() -> None:
+    graph: DependencyGraph = DependencyGraph()
+    data: Dict[str, int] = {'a': 1}
+
+    def cell(name: str) -> int:
+        return data[name]
+
+    def rows() -> Iterator[int]:
+        yield cell_f('a')
+        yield cell_f('a') * 10
+
+    cell_f: MemoizedFunctionWrapper[int] = memoize(cell, True, ConcurrentCache[CallParams, Any](), dependencies = graph)
+    rows_f: MemoizedFunctionWrapper[Iterator[int]] = memoize(rows, True, ConcurrentCache[CallParams, Any](), dependencies = graph)
+    assert list(rows_f()) == [1, 10]
+    assert list(rows_f()) == [1, 10]
+    data['a'] = 2
+    cell_f.cache.forget(CallParams.create(None, ('a', ), {}))
+    assert not rows_f.cache.has_cached(CallParams.create(None, (), {}))
+    assert list(rows_f()) == [2, 20]